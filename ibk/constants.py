@@ -3,6 +3,9 @@ import pathlib
 
 from ibk.private_constants import TWS_PAPER_ACCT_NUM, TWS_PROD_ACCT_NUM, FILENAME_CONTRACTS, DIRECTORY_LOGS
 
+# The file used to cache market data that rarely changes (e.g., first available dates)
+FILENAME_MARKETDATA_CACHE = str(pathlib.Path(FILENAME_CONTRACTS).parent / 'marketdata_cache.pkl')
+
 # The host IP
 HOST_IP = "127.0.0.1"
 
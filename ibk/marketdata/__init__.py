@@ -5,6 +5,7 @@
     IB restrictions on frequency and amount of requests in order to avoid throttling.
 """
 
+import collections
 import time
 
 import ibk.marketdata.datarequest
@@ -15,15 +16,70 @@ from ibk.marketdata.constants import DEFAULT_USE_RTH
 
 
 def _create_data_request(cls, contract, is_snapshot, **kwargs):
-    """ Private helper method that constructs data request instances. """
-    # Make sure arguments are not included in kwargs
-    kwargs.pop('contract', None)
-    kwargs.pop('is_snapshot', None)
+    """ Private helper method that constructs data request instances.
 
-    # Create a request object for eqch contract
-    reqObj = cls(request_manager, contract, is_snapshot, **kwargs)
+        Snapshot requests are shared between callers asking for identical data:
+        if an identical snapshot request has not finished yet, then that request
+        is returned instead of creating a new one.
+    """
+    return _get_or_create_data_request(cls, contract, is_snapshot, kwargs, _get_kwargs_key(kwargs))
+
+def _get_or_create_data_request(cls, contract, is_snapshot, kwargs, kwargs_key):
+    """ Return an identical request that has not finished if there is one, or else create a new request.
+
+        Only snapshot requests are shared. The shared request keeps count of its callers,
+        so that it is only placed once, and is only cancelled with IB once each of the
+        callers has cancelled it. Streaming requests are never shared.
+
+        Arguments:
+            kwargs: (dict) the keyword arguments used to construct the request.
+            kwargs_key: (tuple) hashable version of 'kwargs' (from _get_kwargs_key),
+                or None if identical requests should not be looked up.
+    """
+    if not is_snapshot or kwargs_key is None or not contract.conId:
+        return cls(request_manager, contract, is_snapshot, **kwargs)
+
+    # Look for an identical request that has not finished yet (it may not have been placed yet)
+    key = (cls.__name__, contract.conId, is_snapshot, kwargs_key)
+    with request_manager._inflight_lock:
+        reqObj = request_manager._inflight.get(key, None)
+        if reqObj is not None and reqObj._is_in_flight():
+            reqObj._n_callers += 1
+        else:
+            # Create a new request, to be shared with any identical requests made before it finishes
+            reqObj = request_manager._inflight[key] = cls(request_manager, contract, is_snapshot, **kwargs)
     return reqObj
 
+def _get_kwargs_key(kwargs):
+    """ Get a hashable key from the keyword arguments, or None if they are not hashable. """
+    key = tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    else:
+        return key
+
+def place_requests(reqObjs, priority=0):
+    """ Place a list of data requests (or multi-requests) with the RequestManager.
+
+        The requests are handed to each request manager in a single batch, rather
+        than being placed one at a time, so each request queue is only woken once.
+
+        Arguments:
+            reqObjs: (list) the data requests to place.
+            priority: (float) indicates the relative priority with which the requests
+                will be processed, compared to other requests in the queue.
+    """
+    # Identical requests are shared, so the same request can appear more than once
+    batches = collections.defaultdict(dict)
+    for reqObj in reqObjs:
+        if reqObj not in batches[reqObj.request_manager]:
+            batches[reqObj.request_manager].update(dict.fromkeys(reqObj._get_requests_to_place()))
+
+    for manager, batch in batches.items():
+        manager.place_requests(list(batch), priority=priority)
+
 def create_market_data_request(contract, is_snapshot, fields=""):
     """ Create a MarketDataRequest object for getting  current market data.
 
@@ -36,55 +92,70 @@ def create_market_data_request(contract, is_snapshot, fields=""):
                 in additional to the default data codes. A list of available
                 additional tick data codes are available on the IB website.
     """
-    _args = [ibk.marketdata.datarequest.MarketDataRequest, contract, is_snapshot]
-    _kwargs = dict(fields=fields)
-    return _create_data_request(*_args, **_kwargs)
+    return _create_data_request(ibk.marketdata.datarequest.MarketDataRequest,
+                                contract, is_snapshot, fields=fields)
 
 def create_historical_data_request(contract, is_snapshot, frequency,
                                    use_rth=DEFAULT_USE_RTH, data_type="TRADES",
                                    start="", end="", duration=""):
     """ Create a HistoricalDataRequest object for getting historical data.
     """         
-    _args = [ibk.marketdata.datarequest.HistoricalDataMultiRequest, contract, is_snapshot]
-    _kwargs = dict(frequency=frequency, start=start, end=end, duration=duration,
-                                            use_rth=use_rth, data_type=data_type)
-    return _create_data_request(*_args, **_kwargs)
+    return _create_data_request(ibk.marketdata.datarequest.HistoricalDataMultiRequest,
+                                contract, is_snapshot, frequency=frequency, start=start, end=end,
+                                duration=duration, use_rth=use_rth, data_type=data_type)
+
+def make_historical_factory(frequency, use_rth=DEFAULT_USE_RTH, data_type="TRADES",
+                            start="", end="", duration="", is_snapshot=True):
+    """ Create a function that makes historical data requests with the same arguments.
+
+        This is faster than calling create_historical_data_request in a loop when
+        requesting the same data for many contracts (e.g. when back-filling data),
+        because the arguments are only processed once.
+
+        Returns a function that takes a contract and returns a HistoricalDataMultiRequest.
+    """
+    cls = ibk.marketdata.datarequest.HistoricalDataMultiRequest
+    kwargs = dict(frequency=frequency, start=start, end=end, duration=duration,
+                  use_rth=use_rth, data_type=data_type)
+    kwargs_key = _get_kwargs_key(kwargs)
+
+    def factory(contract):
+        return _get_or_create_data_request(cls, contract, is_snapshot, kwargs, kwargs_key)
+    return factory
 
 def create_streaming_bar_data_request(contract, frequency='5s', 
                                       use_rth=DEFAULT_USE_RTH, data_type="TRADES"):
     """ Create a data request object for getting streaming bar data. """
-    is_snapshot = False
-    _args = [ibk.marketdata.datarequest.StreamingBarRequest, contract, is_snapshot]
-    _kwargs = dict(frequency=frequency, use_rth=use_rth, data_type=data_type)
-    return _create_data_request(*_args, **_kwargs)
+    return _create_data_request(ibk.marketdata.datarequest.StreamingBarRequest, contract, False,
+                                frequency=frequency, use_rth=use_rth, data_type=data_type)
 
 def create_streaming_tick_data_request(contract, data_type="Last",
                                     number_of_ticks=1000, ignore_size=True):
     """ Create a data request object for getting streaming tick data. """
-    is_snapshot = False
-    _args = [ibk.marketdata.datarequest.StreamingTickDataRequest, contract, is_snapshot]
-    _kwargs = dict(data_type=data_type, number_of_ticks=number_of_ticks, ignore_size=ignore_size)
-    return _create_data_request(*_args, **_kwargs)
+    return _create_data_request(ibk.marketdata.datarequest.StreamingTickDataRequest, contract, False,
+                                data_type=data_type, number_of_ticks=number_of_ticks,
+                                ignore_size=ignore_size)
 
 def create_historical_tick_data_request(contract, use_rth=DEFAULT_USE_RTH, data_type="TRADES",
                                    start="", end="", number_of_ticks=1000):
     """ Create a data request object for getting historical tick data. """
-    is_snapshot = True
-    _args = [ibk.marketdata.datarequest.HistoricalTickDataRequest, contract, is_snapshot]
-    _kwargs = dict(data_type=data_type, start=start, end=end, use_rth=use_rth,
-                                            number_of_ticks=number_of_ticks)
-    return _create_data_request(*_args, **_kwargs)
-
-def create_fundamental_data_request(contract, report_type, options=None):
-    """ Create a data request object for getting fundamental data. """
+    return _create_data_request(ibk.marketdata.datarequest.HistoricalTickDataRequest, contract, True,
+                                data_type=data_type, start=start, end=end, use_rth=use_rth,
+                                number_of_ticks=number_of_ticks)
+
+def create_fundamental_data_request(contract, report_type, options=None, bypass_cache=False):
+    """ Create a data request object for getting fundamental data.
+
+        Fundamental data reports (other than "ratios") are cached on disk,
+        unless 'bypass_cache' is True.
+    """
     if report_type == "ratios":
-        is_snapshot = False
-        _args = [ibk.marketdata.datarequest.FundamentalMarketDataRequest, contract, is_snapshot]
-        _kwargs = dict()
-        return _create_data_request(*_args, **_kwargs)
+        return _create_data_request(ibk.marketdata.datarequest.FundamentalMarketDataRequest,
+                                    contract, False)
     else:
-        return ibk.marketdata.datarequest.FundamentalDataRequest(contract,
-                is_snapshot=True, report_type=report_type, options=options)
+        return _create_data_request(ibk.marketdata.datarequest.FundamentalDataRequest, contract, True,
+                                    report_type=report_type, options=options,
+                                    bypass_cache=bypass_cache)
 
 def create_scanner_data_request(scanSubObj, options=None, filters=None):
     """ Create a data request object for creating a scanner. """
@@ -97,16 +168,18 @@ def create_scanner_params_request():
     is_snapshot = False
     return ibk.marketdata.datarequest.ScannerParametersDataRequest(request_manager, dataObj, is_snapshot)
 
-def create_first_date_request(contract):
-    """ Create a data request object for getting the first available date of historical data. """
-    is_snapshot = True
-    _args = [ibk.marketdata.datarequest.HeadTimeStampDataRequest, contract, is_snapshot]
-    return _create_data_request(*_args)
+def create_first_date_request(contract, bypass_cache=False):
+    """ Create a data request object for getting the first available date of historical data.
+
+        The first available date is cached on disk, unless 'bypass_cache' is True.
+    """
+    return _create_data_request(ibk.marketdata.datarequest.HeadTimeStampDataRequest, contract, True,
+                                bypass_cache=bypass_cache)
 
-def get_first_date(contract, max_wait_time=10):
+def get_first_date(contract, max_wait_time=10, bypass_cache=False):
     """ Get the first date on which historical data is available. 
     """
-    req = create_first_date_request(contract)
+    req = create_first_date_request(contract, bypass_cache=bypass_cache)
     req.place_request()
 
     t0 = time.time()
@@ -13,7 +13,11 @@ Classes
         of the methods are over-rides of the IBWrapper commands to customize
         the functionality.
 """
-import datetime
+import collections.abc
+import logging
+import threading
+import time
+import weakref
 import numpy as np
 
 from ibapi.contract import ContractDetails
@@ -22,12 +26,39 @@ from ibapi.common import BarData, TickAttrib
 
 import ibk.base
 import ibk.connect
-import ibk.marketdata.constants
+from ibk.marketdata.constants import (FUNDAMENTAL_TICK_DATA_CODE, LAST_TIMESTAMP,
+                                     STATUS_REQUEST_COMPLETE, STATUS_REQUEST_ERROR)
 import ibk.marketdata.datarequest
 
-# Activate latency monitoring for tests of streaming data
+# Activate latency monitoring for tests of streaming data (use set_monitor_latency to change)
 MONITOR_LATENCY = False
 
+# Log every real-time bar with the ibapi EWrapper logger (only read when an app is created)
+LOG_REALTIME_BARS = False
+
+# Number of seconds between the heartbeat requests that check each app's connection
+HEARTBEAT_INTERVAL_SECS = 30
+
+# An app is considered unhealthy if it has not received a heartbeat reply within this time
+HEARTBEAT_TIMEOUT_SECS = 60
+
+# Maximum number of seconds to wait between attempts to reconnect an unhealthy app
+MAX_RECONNECT_BACKOFF_SECS = 300
+
+# Clock used to measure the latency of streaming data
+_now = time.time
+
+# Names of the fields (columns) stored by the streaming callbacks.
+#    The callbacks all run on the app's reader thread and only append to lists,
+#    so each value is stored immediately without any locking or batching.
+_REALTIME_BAR_FIELDS = ('date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount')
+_TICK_ALL_LAST_FIELDS = ('time', 'price', 'size', 'tickAttribLast', 'exchange', 'specialConditions')
+_TICK_BID_ASK_FIELDS = ('time', 'bidPrice', 'askPrice', 'bidSize', 'askSize', 'tickAttribBidAsk')
+_TICK_MIDPOINT_FIELDS = ('time', 'midPoint')
+
+# Map from IB tick type codes to their names, so callbacks avoid a method call per tick
+_TICK_NAMES = {idx: TickTypeEnum.to_str(idx) for idx in range(TickTypeEnum.NOT_SET + 1)}
+
 
 class MarketDataAppManager:
     """Class for managing a pool of market data connections.
@@ -53,13 +84,19 @@ class MarketDataAppManager:
     def register_app(self, app):
         """ Add new app(s) to make it available for placing/cancelling requests. """
         if isinstance(app, MarketDataApp):
-            self._apps[app.port][app.uniq_id] = app
-        elif isinstance(app, list):
-            for a in app:
-                self.register_app(a)
+            apps = (app,)
+        elif isinstance(app, collections.abc.Iterable):
+            apps = list(app)
+            for a in apps:
+                if not isinstance(a, MarketDataApp):
+                    raise ValueError(f'Unexpected input type "{a.__class__}" for argument "app".')
         else:
             raise ValueError(f'Unexpected input type "{app.__class__}" for argument "app".')
 
+        port_map = self._apps
+        for a in apps:
+            port_map[a.port][a.uniq_id] = a
+
     def creeate_app(self):
         """ Create a new App instance. """
         app = MarketDataApp()
@@ -72,32 +109,125 @@ class MarketDataAppManager:
             app = self.creeate_app()
             self.register_app(app)
         else:
-            uniq_id = np.random.choice(list(self.apps.keys()))
-            app = self.apps[uniq_id]
-            if not app.isConnected():
-                app.reconnect()
+            # Prefer the healthy apps, which are reconnected in the background if needed
+            healthy_ids = [uniq_id for uniq_id, app in self.apps.items() if app.is_healthy()]
+            if healthy_ids:
+                app = self.apps[np.random.choice(healthy_ids)]
+            else:
+                uniq_id = np.random.choice(list(self.apps.keys()))
+                app = self.apps[uniq_id]
+                if not app.isConnected():
+                    app.restart_connection()
 
         return app
 
     def _get_app_from_uniq_id(self, uniq_id):
-        if uniq_id not in self.apps is None:
-            raise ValueError(f"An app with uniq_id {uniq_id} was not found.")
-        else:
+        try:
             return self.apps[uniq_id]
+        except KeyError:
+            raise ValueError(f"An app with uniq_id {uniq_id} was not found.") from None
         
 
 class MarketDataApp(ibk.base.BaseApp):
     """Connection to IB TWS that places data requests and handles callbacks.
     """
-    # Store a map from request Id to DataRequest object
-    requests = dict()
+    # Keep track of the instances, so their callbacks can be re-bound by set_monitor_latency
+    _instances = weakref.WeakSet()
+
+    def __init__(self):
+        super().__init__()
+        self._bind_callbacks()
+        self._instances.add(self)
+
+        # Variables used to check the connection in a background thread
+        self._heartbeat_thread = None
+        self._heartbeat_stop = threading.Event()
+        self._last_heartbeat = None
+
+        # Only one thread at a time can reconnect the app (see 'restart_connection')
+        self._reconnect_lock = threading.Lock()
+        self._n_reconnects = 0
 
-    # Used to retrieve scanner parameters in callback
-    _xml_scanner_params_req_list = []
+        # Store the DataRequest objects in a list indexed by (req_id - _req_base).
+        # IB request Ids are dense integers, so this avoids hashing the Id in every callback.
+        self._requests = []
+        self._req_base = None
+
+        # Keep track of the req_ids of requests that may still be active
+        self._active = set()
+
+        # Used to retrieve scanner parameters in callback
+        self._xml_scanner_params_req_list = []
 
     def get_active_requests(self):
         """ Return a list of requests that are still active. """
-        return list([reqObj for reqObj in self.requests.values if reqObj.is_active()]) 
+        active_requests = []
+        for req_id in list(self._active):
+            reqObj = self._get_request_object_from_req_id(req_id)
+            if reqObj.is_active():
+                active_requests.append(reqObj)
+            else:
+                # The request finished without a callback (e.g. it was cancelled)
+                self._active.discard(req_id)
+        return active_requests
+
+    def connect(self, host=None, port=None, clientId=None):
+        """ Establish a connection, and start checking it with heartbeat requests. """
+        super().connect(host=host, port=port, clientId=clientId)
+        self._last_heartbeat = time.monotonic()
+        self._start_heartbeat()
+
+    def is_healthy(self):
+        """ Return True if the app is connected and has recently received a heartbeat reply. """
+        return self.isConnected() and self._last_heartbeat is not None \
+            and time.monotonic() - self._last_heartbeat <= HEARTBEAT_TIMEOUT_SECS
+
+    def restart_connection(self, force=False):
+        """ Reconnect the app if it is not connected.
+
+            The heartbeat thread, the app manager and the request queues all reconnect
+            apps through this method, so that they never act on the same app at once.
+            If another thread reconnects the app while this one is waiting, then the
+            app is not reconnected a second time.
+
+            Arguments:
+                force: (bool) if True, then disconnect and reconnect the app
+                    even if it still appears to be connected.
+        """
+        n_reconnects = self._n_reconnects
+        with self._reconnect_lock:
+            if n_reconnects != self._n_reconnects and self.isConnected():
+                return
+
+            if force and self.isConnected():
+                self.disconnect()
+
+            if not self.isConnected():
+                self.reconnect()
+                self._n_reconnects += 1
+
+    def stop_heartbeat(self):
+        """ Stop the background thread that checks the connection. """
+        self._heartbeat_stop.set()
+
+    def register_request(self, reqObj):
+        """ Save a DataRequest object so that it can be found from its req_id in the callbacks. """
+        if self._req_base is None:
+            self._req_base = reqObj.req_id
+
+        idx = reqObj.req_id - self._req_base
+        if idx < 0 or (idx < len(self._requests) and self._requests[idx] is not None):
+            raise ValueError(f'The request req_id {reqObj.req_id} has already been registered.')
+
+        # Leave a gap for any request Ids that were not used
+        if idx > len(self._requests):
+            self._requests.extend([None] * (idx - len(self._requests)))
+
+        if idx == len(self._requests):
+            self._requests.append(reqObj)
+        else:
+            self._requests[idx] = reqObj
+        self._active.add(reqObj.req_id)
 
     def error(self, reqId: int, errorCode: int, errorString: str):
         """Overide superclass error method to handle request errors.
@@ -105,10 +235,10 @@ class MarketDataApp(ibk.base.BaseApp):
         if errorCode == 162:
             # Historical market data Service error message. 
             super().error(reqId, errorCode, errorString)    
-            reqObj = self.requests[reqId]
+            reqObj = self._get_request_object_from_req_id(reqId)
             if reqObj.is_active():
-                reqObj.cancel_request()
-                reqObj.status = ibk.marketdata.constants.STATUS_REQUEST_ERROR
+                reqObj._cancel_request_with_ib(self)
+                reqObj._set_status(STATUS_REQUEST_ERROR)
         else:
             # Otherwise just use the superclass method
             super().error(reqId, errorCode, errorString)
@@ -117,83 +247,171 @@ class MarketDataApp(ibk.base.BaseApp):
     # Private methods
     ##############################################################################
 
+    def _start_heartbeat(self):
+        """ Start the background thread that checks the connection (if not already running). """
+        if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+            self._heartbeat_stop.clear()
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat,
+                                                      name=f'{self.thread_name}-heartbeat',
+                                                      daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """ Periodically request the current time from IB, and reconnect if there is no reply.
+
+            Sockets can die silently (e.g. behind a NAT or firewall), and the app
+            would otherwise only notice on the next request. Reconnecting here means
+            that callers of 'get_app' do not have to wait for the reconnection.
+        """
+        backoff = HEARTBEAT_INTERVAL_SECS
+        while not self._heartbeat_stop.wait(HEARTBEAT_INTERVAL_SECS):
+            try:
+                if self.is_healthy():
+                    self.reqCurrentTime()
+                    backoff = HEARTBEAT_INTERVAL_SECS
+                else:
+                    self.restart_connection(force=True)
+            except Exception:
+                # Any error (e.g. a dead socket) must not stop the thread, or the connection is no longer checked
+                logging.exception(f'Heartbeat failed for {self.thread_name}. Retrying in {backoff} seconds.')
+                if self._heartbeat_stop.wait(backoff):
+                    break
+                backoff = min(2 * backoff, MAX_RECONNECT_BACKOFF_SECS)
+
+    def _bind_callbacks(self):
+        """ Bind the handlers of the streaming callbacks directly to the instance.
+
+            The ibapi decoder looks up e.g. 'tickPrice' on the app for every message.
+            Saving the bound handlers as instance attributes (which shadow the
+            methods of the same name defined below) avoids creating a new bound
+            method and an extra call for every tick.
+        """
+        self.tickPrice = self._handle_market_data_callback
+        self.tickSize = self._handle_market_data_callback
+        self.tickString = self._handle_market_data_callback
+        self.tickByTickAllLast = self._handle_tickByTickAllLast_callback
+        self.tickByTickBidAsk = self._handle_tickByTickBidAsk_callback
+        self.tickByTickMidPoint = self._handle_tickByTickMidPoint_callback
+        if not LOG_REALTIME_BARS:
+            self.realtimeBar = self._handle_realtimeBar_callback
+
     def _get_request_object_from_req_id(self, req_id):
-        if req_id not in self.requests is None:
+        try:
+            reqObj = self._requests[req_id - self._req_base]
+        except (IndexError, TypeError):
+            reqObj = None
+
+        if reqObj is None or req_id < self._req_base:
             raise ValueError(f"The request object's request Id {req_id} was not found.")
         else:
-            return self.requests[req_id]
+            return reqObj
 
     def _handle_callback_end(self, req_id, *args):
         reqObj = self._get_request_object_from_req_id(req_id)
-        reqObj.status = ibk.marketdata.constants.STATUS_REQUEST_COMPLETE
+        reqObj._set_status(STATUS_REQUEST_COMPLETE)
+        self._active.discard(req_id)
 
     def _handle_market_data_callback(self, req_id, field, val, attribs=None):
         reqObj = self._get_request_object_from_req_id(req_id)
-        field_name = TickTypeEnum.to_str(field)
-        if field == ibk.marketdata.constants.LAST_TIMESTAMP:
+        field_name = _TICK_NAMES.get(field)
+        if field_name is None:
+            field_name = TickTypeEnum.to_str(field)
+        if field == LAST_TIMESTAMP:
             val = int(val)
 
         # Store the value
         reqObj._append_data({field_name: val})
 
         # If it is a fundamental data request, we can close the stream and request
-        if field == ibk.marketdata.constants.FUNDAMENTAL_TICK_DATA_CODE \
+        if field == FUNDAMENTAL_TICK_DATA_CODE \
                 and isinstance(reqObj, ibk.marketdata.datarequest.FundamentalMarketDataRequest):
             # Close the stream by cancelling the request
             reqObj._cancel_request_with_ib(self)
 
             # Register the request as 'completed' instead of 'cancelled'
-            reqObj.status = ibk.marketdata.constants.STATUS_REQUEST_COMPLETE
+            reqObj._set_status(STATUS_REQUEST_COMPLETE)
+            self._active.discard(req_id)
 
     def _handle_historical_data_callback(self, req_id, bar, is_update):
         reqObj = self._get_request_object_from_req_id(req_id)
         data = bar.__dict__
         if is_update:
             if MONITOR_LATENCY:
-                data['time_received'] = datetime.datetime.now()
+                data['time_received'] = _now()
             reqObj._update_data(data)
         else:
             reqObj._append_data(data)
 
-    def _handle_realtimeBar_callback(self, req_id, date, _open, high, low, close, volume, WAP, count):
+    def _handle_realtimeBar_callback_plain(self, req_id, date, _open, high, low, close, volume, WAP, count):
         reqObj = self._get_request_object_from_req_id(req_id)
-        bar = dict(date=date, open=_open, high=high, low=low, close=close, volume=volume,
-                   average=WAP, barCount=count)
-        if MONITOR_LATENCY:
-            bar['latency'] = datetime.datetime.now().timestamp() - date
-        reqObj._append_data(bar)
+        a_date, a_open, a_high, a_low, a_close, a_volume, a_average, a_barCount = \
+            reqObj._get_column_appenders(_REALTIME_BAR_FIELDS)
+        a_date(date)
+        a_open(_open)
+        a_high(high)
+        a_low(low)
+        a_close(close)
+        a_volume(volume)
+        a_average(WAP)
+        a_barCount(count)
 
     def _handle_historical_tick_data_callback(self, req_id, ticks, done):
         reqObj = self._get_request_object_from_req_id(req_id)
         if ticks:
             reqObj._extend_data(ticks)
         if done:
-            reqObj.status = ibk.marketdata.constants.STATUS_REQUEST_COMPLETE
+            reqObj._set_status(STATUS_REQUEST_COMPLETE)
+            self._active.discard(req_id)
 
-    def _handle_tickByTickAllLast_callback(self, req_id, tickType, _time,
+    def _handle_tickByTickAllLast_callback_plain(self, req_id, tickType, _time,
                                            price, size, tickAttribLast, exchange, specialConditions):
         reqObj = self._get_request_object_from_req_id(req_id)
-        data = dict(time=_time, price=price, size=size, tickAttribLast=tickAttribLast,
-                    exchange=exchange, specialConditions=specialConditions)
-        if MONITOR_LATENCY:
-            data['latency'] = datetime.datetime.now().timestamp() - _time
-        reqObj._append_data(data)
-
-    def _handle_tickByTickBidAsk_callback(self, req_id, _time, bidPrice, askPrice,
+        a_time, a_price, a_size, a_tickAttribLast, a_exchange, a_specialConditions = \
+            reqObj._get_column_appenders(_TICK_ALL_LAST_FIELDS)
+        a_time(_time)
+        a_price(price)
+        a_size(size)
+        a_tickAttribLast(tickAttribLast)
+        a_exchange(exchange)
+        a_specialConditions(specialConditions)
+
+    def _handle_tickByTickBidAsk_callback_plain(self, req_id, _time, bidPrice, askPrice,
                                           bidSize, askSize, tickAttribBidAsk):
         reqObj = self._get_request_object_from_req_id(req_id)
-        data = dict(time=_time, bidPrice=biedPrice, askPrice=askPrice, bidSize=bidSize,
-                    askSize=askSize, tickAttribBidAsk=tickAttribBidAsk)
-        if MONITOR_LATENCY:
-            data['latency'] = datetime.datetime.now().timestamp() - _time
-        reqObj._append_data(data)
+        a_time, a_bidPrice, a_askPrice, a_bidSize, a_askSize, a_tickAttribBidAsk = \
+            reqObj._get_column_appenders(_TICK_BID_ASK_FIELDS)
+        a_time(_time)
+        a_bidPrice(bidPrice)
+        a_askPrice(askPrice)
+        a_bidSize(bidSize)
+        a_askSize(askSize)
+        a_tickAttribBidAsk(tickAttribBidAsk)
+
+    def _handle_tickByTickMidPoint_callback_plain(self, req_id, _time, midPoint):
+        reqObj = self._get_request_object_from_req_id(req_id)
+        a_time, a_midPoint = reqObj._get_column_appenders(_TICK_MIDPOINT_FIELDS)
+        a_time(_time)
+        a_midPoint(midPoint)
 
-    def _handle_tickByTickMidPoint_callback(self, req_id, _time, midPoint):
+    def _handle_realtimeBar_callback_latency(self, req_id, date, *args):
+        self._handle_realtimeBar_callback_plain(req_id, date, *args)
         reqObj = self._get_request_object_from_req_id(req_id)
-        data = dict(time=_time, midPoint=midPoint)
-        if MONITOR_LATENCY:
-            data['latency'] = datetime.datetime.now().timestamp() - _time
-        reqObj._append_data(data)
+        reqObj._columns['latency'].append(_now() - date)
+
+    def _handle_tickByTickAllLast_callback_latency(self, req_id, tickType, _time, *args):
+        self._handle_tickByTickAllLast_callback_plain(req_id, tickType, _time, *args)
+        reqObj = self._get_request_object_from_req_id(req_id)
+        reqObj._columns['latency'].append(_now() - _time)
+
+    def _handle_tickByTickBidAsk_callback_latency(self, req_id, _time, *args):
+        self._handle_tickByTickBidAsk_callback_plain(req_id, _time, *args)
+        reqObj = self._get_request_object_from_req_id(req_id)
+        reqObj._columns['latency'].append(_now() - _time)
+
+    def _handle_tickByTickMidPoint_callback_latency(self, req_id, _time, *args):
+        self._handle_tickByTickMidPoint_callback_plain(req_id, _time, *args)
+        reqObj = self._get_request_object_from_req_id(req_id)
+        reqObj._columns['latency'].append(_now() - _time)
 
     def _handle_headtimestamp_data_callback(self, req_id, timestamp):
         reqObj = self._get_request_object_from_req_id(req_id)
@@ -221,7 +439,7 @@ class MarketDataApp(ibk.base.BaseApp):
         while len(self._xml_scanner_params_req_list):
             reqObj = self._xml_scanner_params_req_list.pop()
             reqObj._xml_params = xmlParams
-            reqObj.status = ibk.marketdata.constants.STATUS_REQUEST_COMPLETE
+            reqObj._set_status(STATUS_REQUEST_COMPLETE)
 
     def scannerData(self, reqId: int, rank: int, contractDetails: ContractDetails,
                     distance: str, benchmark: str, projection: str, legsStr: str):
@@ -257,7 +475,8 @@ class MarketDataApp(ibk.base.BaseApp):
         self._handle_callback_end(reqId)
 
     def realtimeBar(self, reqId, date, _open, high, low, close, volume, WAP, count):
-        super().realtimeBar(reqId, date, _open, high, low, close, volume, WAP, count)
+        if LOG_REALTIME_BARS:
+            super().realtimeBar(reqId, date, _open, high, low, close, volume, WAP, count)
         self._handle_realtimeBar_callback(reqId, date, _open, high, low, close, volume, WAP, count)
 
     def historicalTicks(self, reqId: int, ticks, done: bool):
@@ -282,6 +501,10 @@ class MarketDataApp(ibk.base.BaseApp):
     def tickByTickMidPoint(self, reqId, _time, midPoint):
         self._handle_tickByTickMidPoint_callback(reqId, _time, midPoint)
 
+    def currentTime(self, _time: int):
+        super().currentTime(_time)
+        self._last_heartbeat = time.monotonic()
+
     def headTimestamp(self, reqId: int, timestamp: str):
         self._handle_headtimestamp_data_callback(reqId, timestamp)
         self._handle_callback_end(reqId)
@@ -289,6 +512,30 @@ class MarketDataApp(ibk.base.BaseApp):
 
         
 
+# Streaming callbacks that have separate versions with/without latency monitoring
+_LATENCY_CALLBACKS = ('_handle_realtimeBar_callback',
+                      '_handle_tickByTickAllLast_callback',
+                      '_handle_tickByTickBidAsk_callback',
+                      '_handle_tickByTickMidPoint_callback')
+
+def set_monitor_latency(monitor_latency):
+    """ Turn latency monitoring of streaming data on or off.
+
+        The callbacks are swapped out once here, so that the streaming
+        callbacks do not need to check MONITOR_LATENCY on every update.
+    """
+    global MONITOR_LATENCY
+    MONITOR_LATENCY = monitor_latency
+    suffix = '_latency' if monitor_latency else '_plain'
+    for name in _LATENCY_CALLBACKS:
+        setattr(MarketDataApp, name, getattr(MarketDataApp, name + suffix))
+
+    # Re-bind the callbacks of any existing apps to the new handlers
+    for app in list(MarketDataApp._instances):
+        app._bind_callbacks()
+
+set_monitor_latency(MONITOR_LATENCY)
+
 # Define a global version of the market data manager
 mktdata_manager = MarketDataAppManager()
         
\ No newline at end of file
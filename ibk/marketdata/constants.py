@@ -1,3 +1,5 @@
+import enum
+
 
 # Default arguments
 DEFAULT_USE_RTH = False
@@ -9,26 +11,28 @@ LAST_TIMESTAMP = 45
 FUNDAMENTAL_TICK_DATA_CODE = 47
 
 # Status flags
-STATUS_REQUEST_ERROR = -3                     # request received a TWS error code 162 (possibly no data)
-STATUS_REQUEST_TIMED_OUT = -2                 # request has timed out
-STATUS_REQUEST_CANCELLED = -1                 # request has been cancelled
-STATUS_REQUEST_NEW = 0                        # new request
-STATUS_REQUEST_COMPLETE = 1                   # request is complete
-STATUS_REQUEST_QUEUED = 2                     # is queued in request manager
-STATUS_REQUEST_PROCESSING = 3                 # has been removed from queue and being processed
-STATUS_REQUEST_SENT_TO_IB = 4                 # has been sent to IB
-
-
-# List of all supported request statuses
-STATUS_REQUEST_OPTIONS = (STATUS_REQUEST_ERROR,
-                          STATUS_REQUEST_TIMED_OUT,
-                          STATUS_REQUEST_CANCELLED,
-                          STATUS_REQUEST_NEW,
-                          STATUS_REQUEST_COMPLETE,
-                          STATUS_REQUEST_QUEUED,
-                          STATUS_REQUEST_PROCESSING,
-                          STATUS_REQUEST_SENT_TO_IB,
-                         )
+class RequestStatusCode(enum.IntEnum):
+    ERROR = -3                     # request received a TWS error code 162 (possibly no data)
+    TIMED_OUT = -2                 # request has timed out
+    CANCELLED = -1                 # request has been cancelled
+    NEW = 0                        # new request
+    COMPLETE = 1                   # request is complete
+    QUEUED = 2                     # is queued in request manager
+    PROCESSING = 3                 # has been removed from queue and being processed
+    SENT_TO_IB = 4                 # has been sent to IB
+
+# Aliases for the status flags
+STATUS_REQUEST_ERROR = RequestStatusCode.ERROR
+STATUS_REQUEST_TIMED_OUT = RequestStatusCode.TIMED_OUT
+STATUS_REQUEST_CANCELLED = RequestStatusCode.CANCELLED
+STATUS_REQUEST_NEW = RequestStatusCode.NEW
+STATUS_REQUEST_COMPLETE = RequestStatusCode.COMPLETE
+STATUS_REQUEST_QUEUED = RequestStatusCode.QUEUED
+STATUS_REQUEST_PROCESSING = RequestStatusCode.PROCESSING
+STATUS_REQUEST_SENT_TO_IB = RequestStatusCode.SENT_TO_IB
+
+# Set of all supported request statuses
+STATUS_REQUEST_OPTIONS = frozenset(RequestStatusCode)
 
 # Types of restrictions on data requests
 RESTRICTION_CLASS_SIMUL_HIST = 0
@@ -40,7 +44,7 @@ RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW = 5
 RESTRICTION_CLASS_HF_HIST_LONG_WINDOW = 6
 RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT = 7
 
-RESTRICTION_CLASSES = (
+RESTRICTION_CLASSES = frozenset((
     RESTRICTION_CLASS_SIMUL_HIST,
     RESTRICTION_CLASS_SIMUL_STREAMS,
     RESTRICTION_CLASS_SIMUL_SCANNERS,
@@ -49,4 +53,13 @@ RESTRICTION_CLASSES = (
     RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
     RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
     RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,
-)
+))
+
+# Names of the queues used to process each type of data request
+QUEUE_MONITORING = 'monitoring'
+QUEUE_STREAM = 'stream'
+QUEUE_GENERIC = 'generic'
+QUEUE_SCANNER = 'scanner'
+QUEUE_TICK_STREAM = 'tick_Stream'
+QUEUE_HIST_SMALL_BAR = 'hist_small_bar'
+QUEUE_HIST_LARGE_BAR = 'hist_large_bar'
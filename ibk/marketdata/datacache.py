@@ -0,0 +1,91 @@
+""" A disk-backed cache for market data that rarely (or never) changes.
+
+    Some data requests, such as the first available date of historical data
+    or the fundamental data reports, return results that are either immutable
+    or change slowly. Caching these results avoids sending repeated requests
+    to IB, which are slow and count towards IB's pacing limits.
+"""
+
+import logging
+import os
+import pickle
+import threading
+import time
+
+import ibk.constants
+
+
+# Number of seconds for which cached fundamental data reports remain valid
+FUNDAMENTAL_DATA_CACHE_TTL = 24 * 3600
+
+
+class DataCache:
+    """ Cache of data request results that is saved to a pickle file.
+
+        Arguments:
+            filename: (str) the name of the file used to save the cache.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._data = None
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl=None):
+        """ Get a cached value, or None if the key is missing or has expired.
+
+            Arguments:
+                key: a hashable key identifying the request.
+                ttl: (float) the number of seconds for which a cached value
+                    is valid. If None, then cached values never expire.
+        """
+        with self._lock:
+            entry = self._get_data().get(key, None)
+
+        if entry is None:
+            return None
+        else:
+            t_saved, value = entry
+            if ttl is not None and time.time() - t_saved > ttl:
+                return None
+            else:
+                return value
+
+    def set(self, key, value):
+        """ Save a value in the cache and write the cache to file. """
+        with self._lock:
+            self._get_data()[key] = (time.time(), value)
+
+            # Write to a temporary file first, so that a crash (or another process)
+            #    can never leave a partially written cache file behind
+            tmp_filename = f'{self.filename}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_filename, 'wb') as handle:
+                    pickle.dump(self._data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_filename, self.filename)
+            finally:
+                if os.path.exists(tmp_filename):
+                    os.remove(tmp_filename)
+
+    def clear(self):
+        """ Remove all cached values. """
+        with self._lock:
+            self._data = dict()
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+    def _get_data(self):
+        """ Load the cached values from file the first time they are needed. """
+        if self._data is None:
+            self._data = dict()
+            if os.path.exists(self.filename):
+                try:
+                    with open(self.filename, 'rb') as handle:
+                        self._data = pickle.load(handle)
+                except (EOFError, pickle.UnpicklingError):
+                    # The file is corrupt, so start again with an empty cache
+                    logging.warning(f'{self.__class__}:_get_data:Ignoring corrupt cache file:{self.filename}')
+        return self._data
+
+
+# Define a global version of the data cache
+data_cache = DataCache(ibk.constants.FILENAME_MARKETDATA_CACHE)
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
 
+import collections
 import datetime
-import copy
-import tempfile
+import functools
+import itertools
+import operator
+import threading
 import xml.etree.ElementTree as ET
 import ibapi.contract
 import numpy as np
@@ -12,6 +15,24 @@ import pytz
 import ibk.helper
 from ibk.constants import TIMEZONE_UTC
 import ibk.marketdata.constants
+from ibk.marketdata.constants import (RESTRICTION_CLASS_HF_HIST_IDENTICAL,
+                                     RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
+                                     RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
+                                     RESTRICTION_CLASS_SIMUL_HIST,
+                                     RESTRICTION_CLASS_SIMUL_SCANNERS,
+                                     RESTRICTION_CLASS_SIMUL_STREAMS,
+                                     RESTRICTION_CLASS_SIMUL_TICK_STREAMS,
+                                     RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,
+                                     QUEUE_GENERIC, QUEUE_HIST_LARGE_BAR, QUEUE_HIST_SMALL_BAR,
+                                     QUEUE_SCANNER, QUEUE_STREAM, QUEUE_TICK_STREAM,
+                                     STATUS_REQUEST_CANCELLED,
+                                     STATUS_REQUEST_COMPLETE,
+                                     STATUS_REQUEST_ERROR,
+                                     STATUS_REQUEST_NEW,
+                                     STATUS_REQUEST_PROCESSING,
+                                     STATUS_REQUEST_QUEUED,
+                                     STATUS_REQUEST_SENT_TO_IB)
+import ibk.marketdata.datacache
 
 
 # The number of rows that the market scanner returns by default
@@ -23,9 +44,70 @@ SMALL_BAR_CUTOFF_SIZE = 30
 # Default maximum number of restart attempts when IB does not return any data
 DEFAULT_MAX_RESTARTS = 2
 
-
+# Numpy dtypes used to store the fields of the historical bars returned by IB
+HISTORICAL_BAR_DTYPES = dict(date=object, open='f8', high='f8', low='f8', close='f8',
+                             volume='i8', barCount='i8', average='f8')
+
+# Limits on the number of historical bars for which space is allocated before the data arrives
+MIN_BAR_CAPACITY = 64
+MAX_BAR_CAPACITY = 100000
+
+# Fields of the fundamental ratios that are dates or strings (all other fields are numeric)
+FUNDAMENTAL_DATE_COLS = frozenset(('LATESTADATE',))
+FUNDAMENTAL_STRING_COLS = frozenset(('CURRENCY',))
+
+# Value used by IB for missing fundamental ratios
+FUNDAMENTAL_MISSING_VALUE = -99999.99
+
+# Map from the tick types of streaming tick requests to their data types
+TICK_TYPE_DATA_TYPES = {'Last': 'LAST', 'AllLast': 'LAST', 'BidAsk': 'BID_ASK', 'MidPoint': 'MIDPOINT'}
+
+# Columns of the tick data DataFrames, and getters to extract them from each tick
+_TICK_COLS = ('time', 'price', 'size')
+_TICK_ITEMGETTER = operator.itemgetter(*_TICK_COLS)
+_TICK_ATTRGETTER = operator.attrgetter(*_TICK_COLS)
+_TICK_DTYPE = np.dtype([('time', 'i8'), ('price', 'f8'), ('size', 'i8')])
+
+# Used to assign a unique identifier to each data request
+_uniq_id_counter = itertools.count()
+
+# Restrictions on historical bar requests, keyed by (is_snapshot, is_small_bar)
+#    All historical requests count towards the number of simultaneous historical requests.
+#    Streaming requests also use a market data line, and high-frequency (small bar)
+#    requests are subject to IB's pacing restrictions.
+_HF_HIST_RESTRICTIONS = (RESTRICTION_CLASS_HF_HIST_IDENTICAL,
+                         RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
+                         RESTRICTION_CLASS_HF_HIST_LONG_WINDOW)
+_HISTORICAL_RESTRICTIONS = {
+    (True, False): (RESTRICTION_CLASS_SIMUL_HIST,),
+    (True, True): (RESTRICTION_CLASS_SIMUL_HIST,) + _HF_HIST_RESTRICTIONS,
+    (False, False): (RESTRICTION_CLASS_SIMUL_HIST, RESTRICTION_CLASS_SIMUL_STREAMS),
+    (False, True): (RESTRICTION_CLASS_SIMUL_HIST, RESTRICTION_CLASS_SIMUL_STREAMS) + _HF_HIST_RESTRICTIONS,
+}
+
+# Restrictions on historical tick requests, keyed by is_snapshot
+_HISTORICAL_TICK_RESTRICTIONS = {
+    True: (RESTRICTION_CLASS_SIMUL_HIST,) + _HF_HIST_RESTRICTIONS,
+    False: (RESTRICTION_CLASS_SIMUL_HIST,) + _HF_HIST_RESTRICTIONS + (RESTRICTION_CLASS_SIMUL_TICK_STREAMS,),
+}
+
+# Restrictions on the remaining types of requests
+_NO_RESTRICTIONS = ()
+_SCANNER_RESTRICTIONS = (RESTRICTION_CLASS_SIMUL_SCANNERS,)
+_STREAMING_RESTRICTIONS = (RESTRICTION_CLASS_SIMUL_STREAMS,)
+_TICK_STREAM_RESTRICTIONS = (RESTRICTION_CLASS_SIMUL_TICK_STREAMS,
+                             RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,)
+
+
+# Statuses after which a request no longer needs to be held by its request queue
+_DONE_STATUSES = frozenset((STATUS_REQUEST_SENT_TO_IB, STATUS_REQUEST_COMPLETE,
+                            STATUS_REQUEST_CANCELLED, STATUS_REQUEST_ERROR))
+
+
+@functools.total_ordering
 class DataRequest(ABC):
-    _internal_counter = [0]
+    __slots__ = ('request_manager', 'is_snapshot', 'dataObj', 'uniq_id', '_status', 'req_id',
+                 'n_restarts', 'max_restarts', '_done_event', '_n_callers', '__weakref__')
 
     def __init__(self, request_manager, dataObj, is_snapshot, **kwargs):
         self.request_manager = request_manager
@@ -33,11 +115,12 @@ class DataRequest(ABC):
         self.dataObj = dataObj
 
         # Set a unique identifier
-        self.uniq_id = self._internal_counter[0]
-        self._internal_counter[0] += 1
+        self.uniq_id = next(_uniq_id_counter)
 
         # Set additional internal variables
-        self._status = ibk.marketdata.constants.STATUS_REQUEST_NEW
+        self._status = STATUS_REQUEST_NEW
+        self._done_event = threading.Event()    # Set once the request reaches one of the _DONE_STATUSES
+        self._n_callers = 1                     # Identical snapshot requests are shared between callers
         self.reset()
 
     def reset(self):
@@ -47,13 +130,13 @@ class DataRequest(ABC):
             one can call reset(). Otherwise, an exception will be raised
             for Active/Queued requests on which reset() is called.
         """
-        if self.status not in (ibk.marketdata.constants.STATUS_REQUEST_NEW,
-                               ibk.marketdata.constants.STATUS_REQUEST_COMPLETE,
-                               ibk.marketdata.constants.STATUS_REQUEST_CANCELLED):
+        if self._status not in (STATUS_REQUEST_NEW, STATUS_REQUEST_COMPLETE,
+                                STATUS_REQUEST_CANCELLED):
             raise ValueError('Active or Queued requests must be cancelled before they can be reset.' \
                            + f'This request has status "{self.status}."')
         else:
-            self._status = ibk.marketdata.constants.STATUS_REQUEST_NEW
+            self._status = STATUS_REQUEST_NEW
+            self._done_event.clear()
             self.request_manager._deregister_request(self)
             self.req_id = None
             self._initialize_data()
@@ -67,42 +150,87 @@ class DataRequest(ABC):
                 priority: (float) indicates the relative priority with which the request
                 will be processed, compared to other requests in the queue. The requests
                 with the lowest priority are processed first.
+
+            Requests that are shared between several callers are only placed once.
+        """
+        if self._get_requests_to_place():
+            self.request_manager.place_request(self, priority=priority)
+
+    def _get_requests_to_place(self):
+        """ Get the list of requests that still need to be sent to the RequestManager.
+
+            The list is empty if the request is shared and has already been placed
+            by another caller, or if its data was found in the cache.
         """
-        if self.status != ibk.marketdata.constants.STATUS_REQUEST_NEW:
+        if self._status != STATUS_REQUEST_NEW:
+            if self._n_callers > 1:
+                return []
             raise ValueError(f'Only new requests can be placed. This request has status "{self.status}."')
+        elif self._load_from_cache():
+            # The data was found in the cache, so the request does not need to be sent to IB
+            self.request_manager._register_cached_request(self)
+            return []
         else:
-            self.request_manager.place_request(self, priority=priority)
+            return [self]
 
     def is_active(self):
         """ Check whether a request is still active. """
-        return self.status in (ibk.marketdata.constants.STATUS_REQUEST_QUEUED,
-                               ibk.marketdata.constants.STATUS_REQUEST_PROCESSING,
-                               ibk.marketdata.constants.STATUS_REQUEST_SENT_TO_IB)
+        return self._status in (STATUS_REQUEST_QUEUED, STATUS_REQUEST_PROCESSING,
+                                STATUS_REQUEST_SENT_TO_IB)
+
+    def _is_in_flight(self):
+        """ Check whether a request has not finished yet (including new requests). """
+        return self._status == STATUS_REQUEST_NEW or self.is_active()
 
     def cancel_request(self):
         """ Cancel a request that has been placed with IB.
+
+            A request that is shared between several callers is only cancelled
+            with IB once each of the callers has cancelled it.
         """
         if not self.is_active():
             raise ValueError(f'Only active requests can be cancelled. This request has status "{self.status}."')
-        else:
+        elif not self.request_manager._release_shared_request(self):
             self.request_manager.cancel_request(self)
 
     @property
     def status(self):
         return self._status
-    
-    @status.setter
-    def status(self, s):
+
+    def _set_status(self, s):
+        """ Set the status and record the change with the request manager. """
         if self._status != s:
             self._status = s
+            if s in _DONE_STATUSES:
+                self._done_event.set()
             self.request_manager.update_status(self.uniq_id)
 
     def is_valid_request(self):
         is_valid, msg = True, ""
         return is_valid, msg
 
+    def _load_from_cache(self):
+        """ Load the data from the cache, for subclasses whose results can be cached.
+
+            Returns True if the data was found in the cache, and False otherwise.
+        """
+        return False
+
     def copy(self):
-        return copy.copy(self)
+        """ Return a shallow copy of the request, by copying each of its slots. """
+        cls = self.__class__
+        new = cls.__new__(cls)
+        for name in _get_slot_names(cls):
+            try:
+                setattr(new, name, getattr(self, name))
+            except AttributeError:
+                pass  # The slot has not been set
+
+        # The copy needs its own event, so that waiting on one request is not affected by the other
+        new._done_event = threading.Event()
+        if self._done_event.is_set():
+            new._done_event.set()
+        return new
 
     @abstractmethod
     def get_data(self):
@@ -117,6 +245,12 @@ class DataRequest(ABC):
     def restriction_class(self):
         pass
 
+    @property
+    @abstractmethod
+    def queue_tag(self):
+        """ The name of the queue used to process the request. """
+        pass
+
     @abstractmethod
     def _initialize_data(self):
         pass
@@ -127,12 +261,12 @@ class DataRequest(ABC):
 
     def _place_request_with_ib(self, app):
         """ Place the request with IB. """
-        self.status = ibk.marketdata.constants.STATUS_REQUEST_SENT_TO_IB
+        self._set_status(STATUS_REQUEST_SENT_TO_IB)
         self._place_request_with_ib_core(app)
 
     def _cancel_request_with_ib(self, app):
         """ Cancel the request with IB. """
-        self.status = ibk.marketdata.constants.STATUS_REQUEST_CANCELLED
+        self._set_status(STATUS_REQUEST_CANCELLED)
         self._cancel_request_with_ib_core(app)
 
     @abstractmethod
@@ -144,61 +278,46 @@ class DataRequest(ABC):
 
     @property
     def is_small_bar(self):
-        if not hasattr(self, 'frequency'):
-            return False
-        else:
-            bar_size = ibk.helper.TimeHelper(self.frequency, 'frequency').total_seconds()
-            return bar_size <= SMALL_BAR_CUTOFF_SIZE
+        bar_size = getattr(self, '_freq_seconds', None)
+        return bar_size is not None and bar_size <= SMALL_BAR_CUTOFF_SIZE
 
     def _get_restrictions_on_historical_requests(self):
         """ Used by some subclasses to get restrictions on high-frequency historical requests.
         """
-        # Restriction on number of simultaneous historical constraints
-        res = (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_HIST,)
-        
-        # Constraint on maximum number of simultaneous market data lines (aka streams)
-        if not self.is_snapshot:
-            res = res + (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_STREAMS,)
-
-        # Additional constraints for high frequency data requests
-        bar_size = ibk.helper.TimeHelper(self.frequency, 'frequency').total_seconds()
-        if self.is_small_bar:
-            res = res + (ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_IDENTICAL,
-                         ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-                         ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,)
-        return res
+        return _HISTORICAL_RESTRICTIONS[(bool(self.is_snapshot), self.is_small_bar)]
 
     def _get_restrictions_on_historical_tick_requests(self):
         """ Used by some subclasses to get restrictions on high-frequency historical requests.
         """
-        # Restriction on number of simultaneous historical constraints
-        res = (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_HIST,
-               ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_IDENTICAL,
-               ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-               ibk.marketdata.constants.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW)
-        
-        # Constraint on maximum number of simultaneous market data lines (aka streams)
-        if not self.is_snapshot:
-            res = res + (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_TICK_STREAMS,)
-
-        return res
+        return _HISTORICAL_TICK_RESTRICTIONS[bool(self.is_snapshot)]
 
     def __lt__(self, other):
         return self.uniq_id < other.uniq_id
-
-    def __le__(self, other):
-        return self.uniq_id <= other.uniq_id
-
-    def __gt__(self, other):
-        return self.uniq_id > other.uniq_id
-
-    def __ge__(self, other):
-        return self.uniq_id >= other.uniq_id
     
 
 class DataRequestForContract(DataRequest):
     """ Overload the DataRequest object to work with Contract objects.
     """
+    __slots__ = ('_restriction_keys',)
+
+    def reset(self):
+        super(DataRequestForContract, self).reset()
+        self._restriction_keys = dict()     # Container keys cached by the RestrictionManager
+
+    def copy(self):
+        new = super(DataRequestForContract, self).copy()
+        new._restriction_keys = dict()   # The copy's dates and frequency can be changed before it is placed
+        return new
+
+    @property
+    def identical_key(self):
+        """ A key that is shared by the requests that IB treats as identical. """
+        parts = [self.__class__.__name__, self.contract.localSymbol]
+        for attr in ['start', 'end', 'frequency']:
+            if hasattr(self, attr):
+                parts.append(str(getattr(self, attr)))
+        return '_'.join(parts)
+
     @property
     def contract(self):
         return self.dataObj
@@ -212,6 +331,8 @@ class DataRequestForContract(DataRequest):
 
 
 class ScannerDataRequest(DataRequest):
+    __slots__ = ('options', 'filters', '_market_data')
+
     def __init__(self, request_manager, dataObj, is_snapshot, options=None, filters=None):
         super(ScannerDataRequest, self).__init__(request_manager, dataObj, is_snapshot)
         self.options = options
@@ -234,14 +355,14 @@ class ScannerDataRequest(DataRequest):
 
     # abstractmethod
     def _initialize_data(self):
-        """ Create a list with one element for each ranked instrument.
+        """ Create a dict that will map each rank to the data for the ranked instrument.
         """
-        self._market_data = [{} for _ in range(self.n_rows)]
+        self._market_data = dict()
 
     # abstractmethod
     def has_data(self):
         """ Returns True/False if IB has returned some data. """
-        return any([len(x) for x in self._market_data])
+        return bool(self._market_data)
     
     # abstractmethod
     def _append_data(self, new_data):
@@ -262,15 +383,21 @@ class ScannerDataRequest(DataRequest):
 
     # abstractmethod
     def get_data(self):
-        return self._market_data
+        """ Get a list with one element for each ranked instrument. """
+        return [self._market_data.get(rank, {}) for rank in range(self.n_rows)]
 
     # abstractmethod
     @property
     def restriction_class(self):
-        return (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_SCANNERS,)
+        return _SCANNER_RESTRICTIONS
+
+    # abstractmethod
+    queue_tag = QUEUE_SCANNER
 
 
 class MarketDataRequest(DataRequestForContract):
+    __slots__ = ('fields', '_market_data')
+
     def __init__(self, request_manager, contract, is_snapshot, fields=""):
         super(MarketDataRequest, self).__init__(request_manager, contract, is_snapshot)
         self.fields = fields
@@ -309,71 +436,68 @@ class MarketDataRequest(DataRequestForContract):
     @property
     def restriction_class(self):
         if not self.is_snapshot:
-            return (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_STREAMS,)
+            return _STREAMING_RESTRICTIONS
         else:
-            return tuple()
-
-    def __lt__(self, other):
-        return self.uniq_id < other.uniq_id
+            return _NO_RESTRICTIONS
 
-    def __le__(self, other):
-        return self.uniq_id <= other.uniq_id
-
-    def __gt__(self, other):
-        return self.uniq_id > other.uniq_id
-
-    def __ge__(self, other):
-        return self.uniq_id >= other.uniq_id
+    # abstractmethod
+    @property
+    def queue_tag(self):
+        if not self.is_snapshot:
+            return QUEUE_STREAM
+        else:
+            return QUEUE_GENERIC
 
 
 class FundamentalMarketDataRequest(MarketDataRequest):
+    __slots__ = ()
+
     def __init__(self, request_manager, contract, is_snapshot):
         super(FundamentalMarketDataRequest, self).__init__(request_manager, contract, is_snapshot)
         self.fields = ibk.marketdata.constants.FUNDAMENTAL_TICK_DATA_CODE
             
     def get_data(self):
-        raw_data = self._parse_fundamental_data()
-        return pd.Series(raw_data, name=self.contract.localSymbol)
+        data = self._parse_fundamental_data()
+        data.name = self.contract.localSymbol
+        return data
 
     def _parse_fundamental_data(self):
-        """ Parse the fundamental data that is returned.
+        """ Parse the fundamental data that is returned into a pandas Series.
         """
-        date_cols = ['LATESTADATE']
-        string_cols = ['CURRENCY']
-
-        data = dict()
-        
         # Get the raw data that has been returned by IB
         raw_data = self._market_data.get('FUNDAMENTAL_RATIOS', None)
-        if raw_data is not None:
-            # Parse any fundamental data that has been returned
-            for _item in raw_data.split(';'):
-                if _item:
-                    k, v = _item.split('=')
-                    if k in string_cols:
-                        data[k] = v
-                    elif k in date_cols:
-                        try:
-                            data[k] = pd.Timestamp(v)
-                        except:
-                            data[k] = np.datetime64('NaT')
-                    elif v == "-99999.99":
-                        data[k] = np.nan
-                    elif v == '':
-                        data[k] = np.nan
-                    else:
-                        data[k] = float(v)
-
-        # Return the parsed fundamental data
+        if not raw_data:
+            return pd.Series(dtype=object)
+
+        # Split the 'key=value;key=value;...' string into a Series of strings
+        items = [_item.split('=', 1) for _item in raw_data.split(';') if _item]
+        raw = pd.Series([v for _, v in items], index=[k for k, _ in items], dtype=object)
+
+        # Convert the dates and numbers all at once, leaving the string columns as-is
+        is_date = raw.index.isin(FUNDAMENTAL_DATE_COLS)
+        is_number = ~(is_date | raw.index.isin(FUNDAMENTAL_STRING_COLS))
+        numbers = pd.to_numeric(raw[is_number], errors='coerce')
+
+        data = raw.copy()
+        data[is_number] = numbers.mask(numbers == FUNDAMENTAL_MISSING_VALUE)
+        data[is_date] = pd.to_datetime(raw[is_date], errors='coerce')
         return data
     
             
 class FundamentalDataRequest(DataRequestForContract):
-    def __init__(self, request_manager, contract, is_snapshot, report_type="", options=None):
+    __slots__ = ('report_type', 'options', 'bypass_cache', '_market_data')
+
+    def __init__(self, request_manager, contract, is_snapshot, report_type="", options=None,
+                 bypass_cache=False):
         assert is_snapshot, 'Fundamental Data is not available as a streaming service.'
         super(FundamentalDataRequest, self).__init__(request_manager, contract, is_snapshot)
         self.report_type = report_type
         self.options = options
+        self.bypass_cache = bypass_cache     # True/False - always request the data from IB
+
+    @property
+    def _cache_key(self):
+        return (self.__class__.__name__, self.contract.conId, self.report_type)
 
     # abstractmethod
     def _initialize_data(self):
@@ -388,6 +512,20 @@ class FundamentalDataRequest(DataRequestForContract):
     def _append_data(self, new_data):
         assert self._market_data is None, 'Only expected a single update.'
         self._market_data = new_data
+        if self.contract.conId:
+            ibk.marketdata.datacache.data_cache.set(self._cache_key, new_data)
+
+    def _load_from_cache(self):
+        if self.bypass_cache or not self.contract.conId:
+            return False
+        else:
+            data = ibk.marketdata.datacache.data_cache.get(self._cache_key,
+                        ttl=ibk.marketdata.datacache.FUNDAMENTAL_DATA_CACHE_TTL)
+            if data is None:
+                return False
+            else:
+                self._market_data = data
+                return True
 
     # abstractmethod
     def _place_request_with_ib_core(self, app):
@@ -402,15 +540,25 @@ class FundamentalDataRequest(DataRequestForContract):
     # abstractmethod
     @property
     def restriction_class(self):
-        return tuple()
+        return _NO_RESTRICTIONS
+
+    # abstractmethod
+    queue_tag = QUEUE_GENERIC
 
 
 class HistoricalDataRequest(DataRequestForContract):
+    __slots__ = ('_start', '_end', '_duration', '_frequency', '_freq_helper', '_freq_seconds',
+                 'data_type', 'useRTH', 'formatDate', 'chartOptions', '_columns', '_n_bars', '_capacity',
+                 '_last_date', '_endDateTime', '_durationStr', '_barSizeSetting')
+
     def __init__(self, request_manager, contract, is_snapshot, frequency="",
                  start="", end="", duration="", use_rth=None, 
                  data_type='TRADES'):
         # Initialize some private variables
         self._start = self._end = None
+
+        # The strings sent to IB are cached, and cleared whenever the inputs they depend on change
+        self._endDateTime = self._durationStr = self._barSizeSetting = None
         
         if use_rth is None:
             use_rth = ibk.marketdata.constants.DEFAULT_USE_RTH
@@ -438,9 +586,13 @@ class HistoricalDataRequest(DataRequestForContract):
     def start(self, d):
         if d is None or not d:
             self._start = ''
+        elif isinstance(d, datetime.datetime):
+            # Datetimes (e.g. the periods of split multi-requests) need no conversion
+            self._start = d
         else:
             dt = ibk.helper.convert_to_datetime(d, tz_name=TIMEZONE_UTC)
             self._start = dt
+        self._durationStr = None
 
     @property
     def end(self):
@@ -450,13 +602,41 @@ class HistoricalDataRequest(DataRequestForContract):
     def end(self, d):
         if d is None or not d:
             self._end = ''
+        elif isinstance(d, datetime.datetime):
+            # Datetimes (e.g. the periods of split multi-requests) need no conversion
+            self._end = d
         else:
             dt = ibk.helper.convert_to_datetime(d, tz_name=TIMEZONE_UTC)
             self._end = dt
+        self._endDateTime = self._durationStr = None
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @duration.setter
+    def duration(self, d):
+        self._duration = d
+        self._durationStr = None
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, f):
+        # Parse the frequency once, as the bar size is needed each time the restrictions are checked
+        self._frequency = f
+        if f:
+            self._freq_helper, self._freq_seconds = _parse_frequency(f)
+        else:
+            self._freq_helper = self._freq_seconds = None
+        self._barSizeSetting = None
 
     # abstractmethod
     def get_data(self):
-        return self._market_data
+        columns = self._get_columns()
+        return _get_rows_from_columns({k: v.tolist() for k, v in columns.items()})
 
     def is_valid_request(self):
         is_valid, msg = True, ""
@@ -465,7 +645,7 @@ class HistoricalDataRequest(DataRequestForContract):
                 is_valid = False
                 msg = 'End date cannot be specified for streaming historical data requests.'
 
-            if 5 > ibk.helper.TimeHelper(self.frequency, 'frequency').total_seconds():
+            if 5 > self._freq_seconds:
                 is_valid = False
                 msg = 'Bar frequency for streaming historical data requests must be >= 5 seconds.'
 
@@ -473,26 +653,74 @@ class HistoricalDataRequest(DataRequestForContract):
 
     # abstractmethod
     def _initialize_data(self):
-        self._market_data = []
+        # Bars are stored in numpy arrays (one per field), which are allocated
+        #    for the expected number of bars and grown if more bars arrive
+        self._columns = dict()
+        self._n_bars = 0
+        self._capacity = self._get_expected_number_of_bars()
+        self._last_date = None
 
     # abstractmethod
     def has_data(self):
         """ Returns True/False if IB has returned some data. """
-        return len(self._market_data) > 0
+        return self._n_bars > 0
 
     # abstractmethod
     def _append_data(self, new_data):
-        self._market_data.append(new_data)
+        if self._n_bars == self._capacity:
+            self._grow_columns()
+        self._set_row(self._n_bars, new_data)
+        self._n_bars += 1
+        self._last_date = new_data['date']
 
     def _update_data(self, new_data):
         """Only works for single request objects, and is used for handling streaming updates.
            If the new row has the same date as the previously received row, then replace it.
            Otherwise, just append the new data as normal.
        """
-        if self._market_data and new_data['date'] == self._market_data[-1]['date']:
-            self._market_data[-1] = new_data
+        if self._n_bars and new_data['date'] == self._last_date:
+            self._set_row(self._n_bars - 1, new_data)
         else:
-            self._market_data.append(new_data)
+            self._append_data(new_data)
+
+    def _set_row(self, idx, new_data):
+        """ Write the fields of a bar into the column arrays at the given position. """
+        columns = self._columns
+        for k, v in new_data.items():
+            col = columns.get(k, None)
+            if col is None:
+                col = columns[k] = np.empty(self._capacity, dtype=HISTORICAL_BAR_DTYPES.get(k, object))
+            col[idx] = v
+
+    def _grow_columns(self):
+        """ Double the size of the column arrays. """
+        for k, col in self._columns.items():
+            self._columns[k] = np.concatenate([col, np.empty_like(col)])
+        self._capacity *= 2
+
+    def _get_columns(self):
+        """ Get a dict with the column arrays, restricted to the bars that have been received. """
+        return {k: col[:self._n_bars] for k, col in self._columns.items()}
+
+    def _get_expected_number_of_bars(self):
+        """ Estimate how many bars IB will return, based on the duration and frequency. """
+        bar_size = self._freq_seconds
+        if not bar_size:
+            return MIN_BAR_CAPACITY
+
+        try:
+            if self.duration:
+                period = ibk.helper.TimeHelper(self.duration, time_type='frequency').total_seconds()
+            elif self.start:
+                end = self.end if self.end else datetime.datetime.now(self.start.tzinfo)
+                period = (end - self.start).total_seconds()
+            else:
+                return MIN_BAR_CAPACITY
+        except ValueError:
+            return MIN_BAR_CAPACITY
+        else:
+            n_bars = int(period // bar_size) + 1
+            return min(max(n_bars, MIN_BAR_CAPACITY), MAX_BAR_CAPACITY)
 
     # abstractmethod
     def _place_request_with_ib_core(self, app):
@@ -515,13 +743,25 @@ class HistoricalDataRequest(DataRequestForContract):
     def restriction_class(self):
         return self._get_restrictions_on_historical_requests()
 
+    # abstractmethod
     @property
-    def endDateTime(self) -> str:
-        if not self.end:
-            return ''
+    def queue_tag(self):
+        if not self.is_snapshot:
+            return QUEUE_STREAM
+        elif self.is_small_bar:
+            return QUEUE_HIST_SMALL_BAR
         else:
-            return ibk.helper.convert_datetime_to_tws_date(
-                self.end, tz_name=TIMEZONE_UTC)
+            return QUEUE_HIST_LARGE_BAR
+
+    @property
+    def endDateTime(self) -> str:
+        if self._endDateTime is None:
+            if not self.end:
+                self._endDateTime = ''
+            else:
+                self._endDateTime = ibk.helper.convert_datetime_to_tws_date(
+                    self.end, tz_name=TIMEZONE_UTC)
+        return self._endDateTime
 
     @property
     def keepUpToDate(self):
@@ -529,6 +769,16 @@ class HistoricalDataRequest(DataRequestForContract):
 
     @property
     def durationStr(self):
+        if self._durationStr is None:
+            durationStr = self._get_durationStr()
+            if self.end or not self.start:
+                # The duration is only cached if it does not depend on the current time
+                self._durationStr = durationStr
+            return durationStr
+        else:
+            return self._durationStr
+
+    def _get_durationStr(self):
         if self.start and self.duration:
             raise ValueError('Duration and start cannot both be specified.')
         elif self.duration:
@@ -546,10 +796,12 @@ class HistoricalDataRequest(DataRequestForContract):
 
     @property
     def barSizeSetting(self):
-        if self.frequency:
-            return ibk.helper.TimeHelper(self.frequency, time_type='frequency').to_tws_barSizeSetting()
-        else:
-            return ""
+        if self._barSizeSetting is None:
+            if self.frequency:
+                self._barSizeSetting = self._freq_helper.to_tws_barSizeSetting()
+            else:
+                self._barSizeSetting = ""
+        return self._barSizeSetting
         
     @property
     def whatToShow(self):
@@ -564,7 +816,7 @@ class HistoricalDataRequest(DataRequestForContract):
                 drop_empty_rows: (bool) whether to drop rows that have identical values
                     to the previous row (e.g. drop rows with Volume == 0)
         """
-        raw_df = pd.DataFrame.from_dict(self.get_data())
+        raw_df = pd.DataFrame(self._get_columns())
         if 0 == len(raw_df):
             return pd.DataFrame()
         else:
@@ -573,6 +825,10 @@ class HistoricalDataRequest(DataRequestForContract):
 
 
 class HistoricalDataMultiRequest:
+    __slots__ = ('_start', '_end', 'request_manager', 'contract', 'is_snapshot', 'frequency', 'duration',
+                 'data_type', 'useRTH', 'formatDate', 'chartOptions', 'subrequests', '_n_callers',
+                 '__weakref__')
+
     def __init__(self, request_manager, contract, is_snapshot, frequency="",
                  start="", end="", duration="", use_rth=None, data_type='TRADES'):
         # Initialize some private variables
@@ -593,6 +849,7 @@ class HistoricalDataMultiRequest:
         self.useRTH = use_rth                # True/False - only return regular trading hours
         self.formatDate = 1                  # 1 corresponds to string format
         self.chartOptions = []               # Argument currently required but not supported by IB
+        self._n_callers = 1                  # Identical snapshot requests are shared between callers
 
         self.subrequests = None
         self.subrequests = self._split_into_valid_subrequests()
@@ -605,6 +862,9 @@ class HistoricalDataMultiRequest:
     def start(self, d):
         if d is None or not d:
             self._start = ''
+        elif isinstance(d, datetime.datetime):
+            # Datetimes (e.g. the periods of split multi-requests) need no conversion
+            self._start = d
         else:
             dt = ibk.helper.convert_to_datetime(d, tz_name=TIMEZONE_UTC)
             self._start = dt
@@ -617,6 +877,9 @@ class HistoricalDataMultiRequest:
     def end(self, d):
         if d is None or not d:
             self._end = ''
+        elif isinstance(d, datetime.datetime):
+            # Datetimes (e.g. the periods of split multi-requests) need no conversion
+            self._end = d
         else:
             dt = ibk.helper.convert_to_datetime(d, tz_name=TIMEZONE_UTC)
             self._end = dt
@@ -624,6 +887,9 @@ class HistoricalDataMultiRequest:
     def is_active(self):
         return any([reqObj.is_active() for reqObj in self.subrequests])
 
+    def _is_in_flight(self):
+        return any([reqObj._is_in_flight() for reqObj in self.subrequests])
+
     def place_request(self, priority=0):
         """ Place a request with the RequestManager.
         
@@ -631,15 +897,28 @@ class HistoricalDataMultiRequest:
                 priority: (float) indicates the relative priority with which the request
                 will be processed, compared to other requests in the queue. The requests
                 with the lowest priority are processed first.
+
+            Requests that are shared between several callers are only placed once.
         """
-        for reqObj in self.subrequests:
-            reqObj.place_request(priority=priority)
+        self.request_manager.place_requests(self._get_requests_to_place(), priority=priority)
+
+    def _get_requests_to_place(self):
+        """ Get the list of subrequests that still need to be sent to the RequestManager. """
+        if self._n_callers > 1:
+            # The subrequests may already have been placed by another caller
+            return [reqObj for reqObj in self.subrequests if reqObj.status == STATUS_REQUEST_NEW]
+        else:
+            return [r for reqObj in self.subrequests for r in reqObj._get_requests_to_place()]
 
     def cancel_request(self):
         """ Cancel a request that has been placed with IB.
+
+            A request that is shared between several callers is only cancelled
+            with IB once each of the callers has cancelled it.
         """
-        for reqObj in self.subrequests:
-            reqObj.cancel_request()
+        if not self.request_manager._release_shared_request(self):
+            for reqObj in self.subrequests:
+                reqObj.cancel_request()
 
     def get_data(self):
         return [s.get_data() for s in self.subrequests]
@@ -647,16 +926,15 @@ class HistoricalDataMultiRequest:
     def get_dataframe(self, timestamp=False, drop_empty_rows=True):
         """ Turn the requested data into a dataframe.
         """
-        # Concat all of the individual data sets
-        df_list = []
-        for d in self.get_data():
-            if len(d):
-                df_list.append(pd.DataFrame.from_dict(d))
-        if 0 == len(df_list):
+        columns_list = [reqObj._get_columns() for reqObj in self.subrequests if reqObj.has_data()]
+        if 0 == len(columns_list):
             return pd.DataFrame()
         else:
-            raw_df = pd.concat(df_list)
-            
+            # Join the column arrays of the individual data sets, and build a single DataFrame
+            keys = list(dict.fromkeys(k for columns in columns_list for k in columns))
+            raw_df = pd.DataFrame({k: np.concatenate([_get_column(columns, k) for columns in columns_list])
+                                   for k in keys})
+
             # Construct the combined DataFrame object
             return _get_dataframe(raw_df, start=self.start, end=self.end, data_type=self.data_type,
                            timestamp=timestamp, drop_empty_rows=drop_empty_rows)
@@ -692,15 +970,23 @@ class HistoricalDataMultiRequest:
 
         assert delta.total_seconds() > 0, 'Start time must precede end time.'
         max_delta = bar_freq.get_max_tws_duration_timedelta()
-        period_start = start_tws
-        periods = []
-        while self._get_period_end(period_start, max_delta) < end_tws:
-            period_end = min(end_tws, self._get_period_end(period_start, max_delta))
-            periods.append((period_start, period_end))
-            period_start = period_end
-        if period_start < end_tws:
-            periods.append((period_start, end_tws))
-        return periods
+
+        # Only the first period can be shorter (e.g. ending at 18:00 for daily durations)
+        first_end = self._get_period_end(start_tws, max_delta)
+        if first_end >= end_tws:
+            return [(start_tws, end_tws)]
+
+        # The remaining periods all have the same length, so the boundaries are computed directly
+        if max_delta.total_seconds() >= (3600 * 24):
+            step = datetime.timedelta(days=max_delta.days)
+        else:
+            step = max_delta
+        n_steps, remainder = divmod(end_tws - first_end, step)
+        if not remainder:
+            n_steps -= 1
+
+        boundaries = [start_tws] + [first_end + k * step for k in range(n_steps + 1)] + [end_tws]
+        return list(zip(boundaries[:-1], boundaries[1:]))
 
     def _split_into_valid_subrequests(self):
         """ Split one historical request into multiple to comply with IB window constraints."""
@@ -733,20 +1019,31 @@ class HistoricalDataMultiRequest:
 
             return [reqObj]
         else:
-            reqObjList = []
-            for period in valid_periods:
-                period_start, period_end = period
-
-                reqObj = HistoricalDataRequest(request_manager=self.request_manager,
-                                               contract=self.contract, is_snapshot=self.is_snapshot,
-                                               frequency=self.frequency, duration='',
-                                               start=period_start, end=period_end,
-                                               use_rth=self.useRTH, data_type=self.data_type)
+            # Create the first subrequest, and copy it for the other periods so
+            #    that the common settings (e.g. the frequency) are only parsed once
+            period_start, period_end = valid_periods[0]
+            template = HistoricalDataRequest(request_manager=self.request_manager,
+                                             contract=self.contract, is_snapshot=self.is_snapshot,
+                                             frequency=self.frequency, duration='',
+                                             start=period_start, end=period_end,
+                                             use_rth=self.useRTH, data_type=self.data_type)
+
+            reqObjList = [template]
+            for period_start, period_end in valid_periods[1:]:
+                reqObj = template.copy()
+                reqObj.uniq_id = next(_uniq_id_counter)
+                reqObj.start = period_start
+                reqObj.end = period_end
+                reqObj.chartOptions = []
+                reqObj._initialize_data()
                 reqObjList.append(reqObj)
             return reqObjList
 
 
 class StreamingBarRequest(DataRequestForContract):
+    __slots__ = ('_frequency', '_freq_helper', '_freq_seconds', 'data_type', 'useRTH',
+                 '_columns', '_column_appenders')
+
     def __init__(self, request_manager, contract, is_snapshot, data_type="TRADES", 
                  use_rth=None, frequency='5s'):
         assert not is_snapshot, 'Streaming requests must have is_snapshot == False.'
@@ -759,18 +1056,44 @@ class StreamingBarRequest(DataRequestForContract):
         else:
             self.useRTH = use_rth
 
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, f):
+        # Parse the frequency once, as the bar size is needed each time the restrictions are checked
+        self._frequency = f
+        if f:
+            self._freq_helper, self._freq_seconds = _parse_frequency(f)
+        else:
+            self._freq_helper = self._freq_seconds = None
+
     # abstractmethod
     def _initialize_data(self):
-        self._market_data = []
+        # Bars are stored column-by-column (one list per field) instead of one dict per bar
+        self._columns = collections.defaultdict(list)
+        self._column_appenders = None
 
     # abstractmethod
     def has_data(self):
         """ Returns True/False if IB has returned some data. """
-        return len(self._market_data) > 0
+        return bool(self._columns.get('date'))
 
     # abstractmethod
     def _append_data(self, new_data):
-        self._market_data.append(new_data)
+        for k, v in new_data.items():
+            self._columns[k].append(v)
+
+    def _get_column_appenders(self, fields):
+        """ Get the bound 'append' methods of the columns for the given fields.
+
+            These are cached, so the streaming callbacks can add values to
+            each column without looking up the columns for every update.
+        """
+        if self._column_appenders is None:
+            self._column_appenders = tuple(self._columns[f].append for f in fields)
+        return self._column_appenders
 
     # abstractmethod
     def _place_request_with_ib_core(self, app):
@@ -786,24 +1109,27 @@ class StreamingBarRequest(DataRequestForContract):
 
     # abstractmethod
     def get_data(self):
-        return self._market_data
+        return _get_rows_from_columns(self._columns)
 
     # implement abstractmethod
     @property
     def restriction_class(self):
         return self._get_restrictions_on_historical_requests()
 
+    # abstractmethod
+    queue_tag = QUEUE_STREAM
+
     def get_dataframe(self):
-        cols = ['time', 'price', 'size']
-        prices = [{c: d[c] for c in cols} for d in self.get_data()]
-        df = pd.DataFrame.from_dict(prices)
-        df.rename({'time': 'local_time'}, inplace=True)
-        df.set_index('local_time', inplace=True)
+        # Build the DataFrame directly from the stored columns
+        df = pd.DataFrame(_pad_columns(self._columns))
+        df.rename(columns={'date': 'local_time'}, inplace=True)
+        if 'local_time' in df.columns:
+            df.set_index('local_time', inplace=True)
         return df
 
     def barSizeInSeconds(self):
         if self.frequency:
-            return int(ibk.helper.TimeHelper(self.frequency, time_type='frequency').total_seconds())
+            return int(self._freq_seconds)
         else:
             return -1
 
@@ -814,6 +1140,9 @@ class StreamingTickDataRequest(DataRequestForContract):
         Arguments:
             data_type: (str) allowed values are  "Last", "AllLast", "BidAsk" or "MidPoint"
     """
+    __slots__ = ('_tickType', '_data_type', 'numberOfTicks', 'ignoreSize', '_market_data', '_columns',
+                 '_column_appenders')
+
     def __init__(self, request_manager, contract, is_snapshot, data_type="Last",
                                      number_of_ticks=0, ignore_size=True):
         assert not is_snapshot, 'A Streaming tick request must have is_snapshot == False.'
@@ -824,16 +1153,32 @@ class StreamingTickDataRequest(DataRequestForContract):
 
     # abstractmethod
     def _initialize_data(self):
+        # Historical ticks sent by IB when the stream is opened
         self._market_data = []
 
+        # Streamed ticks are stored column-by-column (one list per field) instead of one dict per tick
+        self._columns = collections.defaultdict(list)
+        self._column_appenders = None
+
     # abstractmethod
     def has_data(self):
         """ Returns True/False if IB has returned some data. """
-        return len(self._market_data) > 0
+        return len(self._market_data) > 0 or bool(self._columns.get('time'))
 
     # abstractmethod
     def _append_data(self, new_data):
-        self._market_data.append(new_data)
+        for k, v in new_data.items():
+            self._columns[k].append(v)
+
+    def _get_column_appenders(self, fields):
+        """ Get the bound 'append' methods of the columns for the given fields.
+
+            These are cached, so the streaming callbacks can add values to
+            each column without looking up the columns for every update.
+        """
+        if self._column_appenders is None:
+            self._column_appenders = tuple(self._columns[f].append for f in fields)
+        return self._column_appenders
 
     # abstractmethod
     def _extend_data(self, new_data):
@@ -841,7 +1186,7 @@ class StreamingTickDataRequest(DataRequestForContract):
 
     # abstractmethod
     def get_data(self):
-        return self._market_data
+        return self._market_data + _get_rows_from_columns(self._columns)
 
     # abstractmethod
     def _place_request_with_ib_core(self, app):
@@ -857,26 +1202,30 @@ class StreamingTickDataRequest(DataRequestForContract):
     # abstractmethod
     @property
     def restriction_class(self):
-        return (ibk.marketdata.constants.RESTRICTION_CLASS_SIMUL_TICK_STREAMS,
-                ibk.marketdata.constants.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,)
+        return _TICK_STREAM_RESTRICTIONS
+
+    # abstractmethod
+    queue_tag = QUEUE_TICK_STREAM
+
+    @property
+    def tickType(self):
+        return self._tickType
+
+    @tickType.setter
+    def tickType(self, t):
+        self._tickType = t
+        self._data_type = TICK_TYPE_DATA_TYPES.get(t, None)
 
     @property
     def data_type(self):
-        if self.tickType in ("Last", "AllLast"):
-            return 'LAST'
-        elif self.tickType == 'BidAsk':
-            return 'BID_ASK'
-        elif self.tickType == 'MidPoint':
-            return 'MIDPOINT'
-        else:
+        if self._data_type is None:
             raise ValueError(f'Unknown tick type: "{self.tickType}".')
+        else:
+            return self._data_type
         
     def get_dataframe(self):
-        cols = ['time', 'price', 'size']
-        prices = [{c: d[c] for c in cols} for d in self.get_data()]
-        df = pd.DataFrame.from_dict(prices)
-        df.set_index('time', inplace=True)
-        return df
+        rows = list(map(_TICK_ITEMGETTER, self.get_data()))
+        return pd.DataFrame.from_records(rows, columns=_TICK_COLS).set_index('time')
 
 
 class HistoricalTickDataRequest(DataRequestForContract):
@@ -885,6 +1234,9 @@ class HistoricalTickDataRequest(DataRequestForContract):
         Arguments:
             data_type: (str) allowed values are 'BID_ASK', 'MIDPOINT', 'TRADES'
     """
+    __slots__ = ('_start', '_end', '_whatToShow', '_data_type', 'useRTH', 'numberOfTicks', 'ignoreSize',
+                 '_market_data')
+
     def __init__(self, request_manager, contract, is_snapshot, start="", end="",
                  use_rth=None, data_type="TRADES", number_of_ticks=1000, ignore_size=True):
         super(HistoricalTickDataRequest, self).__init__(request_manager, contract, is_snapshot)
@@ -943,6 +1295,15 @@ class HistoricalTickDataRequest(DataRequestForContract):
             return ibk.helper.convert_datetime_to_tws_date(
                 self.end, tz_name=TIMEZONE_UTC)
 
+    @property
+    def whatToShow(self):
+        return self._whatToShow
+
+    @whatToShow.setter
+    def whatToShow(self, w):
+        self._whatToShow = w
+        self._data_type = w.upper()
+
     # abstractmethod
     def _initialize_data(self):
         self._market_data = []
@@ -981,32 +1342,41 @@ class HistoricalTickDataRequest(DataRequestForContract):
 
     @property
     def data_type(self):
-        return self.whatToShow.upper()
+        return self._data_type
 
     # abstractmethod
     @property
     def restriction_class(self):
         return self._get_restrictions_on_historical_tick_requests()
 
+    # abstractmethod
+    queue_tag = QUEUE_HIST_SMALL_BAR
+
     def get_dataframe(self):
-        cols = ['time', 'price', 'size']
-        prices = [{c: d.__getattribute__(c) for c in cols} for d in self.get_data()]
-        df = pd.DataFrame.from_dict(prices)
-        df.set_index('time', inplace=True)
-        return df
+        # Fill a typed array of known length, rather than having pandas infer the types of each row
+        ticks = self.get_data()
+        arr = np.fromiter(map(_TICK_ATTRGETTER, ticks), dtype=_TICK_DTYPE, count=len(ticks))
+        return pd.DataFrame(arr).set_index('time')
 
 
 class HeadTimeStampDataRequest(DataRequestForContract):
+    __slots__ = ('data_type', 'useRTH', 'bypass_cache', '_market_data')
+
     def __init__(self, request_manager, contract, is_snapshot=True,
-                 data_type='TRADES', use_rth=None):
+                 data_type='TRADES', use_rth=None, bypass_cache=False):
         if use_rth is None:
             self.useRTH = ibk.marketdata.constants.DEFAULT_USE_RTH
         else:
             self.useRTH = use_rth               # True/False - only return regular trading hours
 
         self.data_type = data_type           # TRADES, ASK, BID, ASK_BID, etc.
+        self.bypass_cache = bypass_cache     # True/False - always request the data from IB
         super(HeadTimeStampDataRequest, self).__init__(request_manager, contract, is_snapshot)
 
+    @property
+    def _cache_key(self):
+        return (self.__class__.__name__, self.contract.conId, self.data_type, self.useRTH)
+
     # abstractmethod
     def _initialize_data(self):
         self._market_data = None
@@ -1020,6 +1390,20 @@ class HeadTimeStampDataRequest(DataRequestForContract):
     def _append_data(self, new_data):
         dt = ibk.helper.convert_datestr_to_datetime(new_data, tz_name=TIMEZONE_UTC)
         self._market_data = dt
+        if self.contract.conId:
+            ibk.marketdata.datacache.data_cache.set(self._cache_key, dt)
+
+    def _load_from_cache(self):
+        if self.bypass_cache or not self.contract.conId:
+            return False
+        else:
+            # The first available date does not change, so cached values never expire
+            data = ibk.marketdata.datacache.data_cache.get(self._cache_key)
+            if data is None:
+                return False
+            else:
+                self._market_data = data
+                return True
 
     # abstractmethod
     def _place_request_with_ib_core(self, app):
@@ -1037,10 +1421,15 @@ class HeadTimeStampDataRequest(DataRequestForContract):
     # abstractmethod
     @property
     def restriction_class(self):
-        return tuple()
+        return _NO_RESTRICTIONS
+
+    # abstractmethod
+    queue_tag = QUEUE_GENERIC
 
 
 class ScannerParametersDataRequest(DataRequest):
+    __slots__ = ('_xml_params', 'data')
+
     def __init__(self, request_manager, dataObj, is_snapshot=False):
         super(ScannerParametersDataRequest, self).__init__(request_manager, dataObj, is_snapshot)
 
@@ -1066,35 +1455,30 @@ class ScannerParametersDataRequest(DataRequest):
     # abstractmethod
     @property
     def restriction_class(self):
-        return tuple()
+        return _NO_RESTRICTIONS
+
+    # abstractmethod
+    queue_tag = QUEUE_GENERIC
 
     # abstractmethod
     def get_data(self):
         if self.data is None and self._xml_params is not None:
-            # Save the XML to a text file so that ElementTree can access the data
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.xml') as tmp_file:
-                tmp_file.writelines(self._xml_params)
-                tmp_file.seek(0)
-
-                # Use the ElementTree to read in the XML
-                tree = ET.parse(tmp_file.name)
+            # Use the ElementTree to read in the XML directly from memory
+            if isinstance(self._xml_params, str):
+                xml_str = self._xml_params
+            else:
+                xml_str = ''.join(self._xml_params)
+            root = ET.fromstring(xml_str)
 
             # Parse the data into dict of dicts by going through branches
-            root = tree.getroot()
             root_dict = {}
             for group in root:
-                root_dict[group.tag] = {}
+                root_dict[group.tag] = group_dict = collections.defaultdict(list)
                 for instrument in group:
-                    if instrument.tag not in root_dict[group.tag]:
-                        root_dict[group.tag][instrument.tag] = []
-
-                    entry = {}
-                    for child in instrument:
-                        entry[child.tag] = child.text
-                    root_dict[group.tag][instrument.tag].append(entry)
+                    group_dict[instrument.tag].append({child.tag: child.text for child in instrument})
 
             # Save the information
-            self.data = root_dict
+            self.data = {tag: dict(group_dict) for tag, group_dict in root_dict.items()}
             
         # Return the parsed data
         return self.data
@@ -1104,13 +1488,55 @@ class ScannerParametersDataRequest(DataRequest):
 # Define helper functions
 ########################################################################
 
+def _get_rows_from_columns(columns):
+    """ Convert data stored column-by-column into a list of dicts (one per row). """
+    columns = _pad_columns(columns)
+    keys = list(columns.keys())
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+def _pad_columns(columns):
+    """ Get a dict of columns that all have the same length.
+
+        Columns that were only added part way through (e.g. 'latency') are
+        shorter than the others, and are padded with None at the beginning.
+    """
+    n_rows = max([len(v) for v in columns.values()], default=0)
+    return {k: v if len(v) == n_rows else [None] * (n_rows - len(v)) + v
+            for k, v in columns.items()}
+
+@functools.lru_cache(maxsize=None)
+def _parse_frequency(frequency):
+    """ Get a TimeHelper for a frequency string, along with the bar size in seconds.
+
+        The frequencies come from a small set of strings (e.g. '1s', '1M', '1d'), so
+        each one is only parsed once and the TimeHelper is shared between requests.
+    """
+    freq_helper = ibk.helper.TimeHelper(frequency, time_type='frequency')
+    return freq_helper, freq_helper.total_seconds()
+
+@functools.lru_cache(maxsize=None)
+def _get_slot_names(cls):
+    """ Get the names of the slots defined by a class and its base classes. """
+    return tuple(name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())
+                 if name != '__weakref__')
+
+def _get_column(columns, key):
+    """ Get a column array, or an array of None if the column is missing. """
+    col = columns.get(key, None)
+    if col is None:
+        n_rows = len(next(iter(columns.values())))
+        col = np.full(n_rows, None, dtype=object)
+    return col
+
 def _restrict_to_start_end_dates(df, start, end, timestamp):
-    """ Remove observations outside of the range. """
-    tws_datetimes = pd.DatetimeIndex(df.index).to_pydatetime()
-    if start is not None and end is not None:
-        rows_to_keep = (start <= tws_datetimes) & (tws_datetimes <= end)
-        df = df.iloc[rows_to_keep]
-    return df
+    """ Remove observations outside of the range.
+
+        The index must already be sorted, so that the rows can be selected with a label slice.
+    """
+    if start is None or end is None or start == '' or end == '':
+        return df
+    else:
+        return df.loc[pd.Timestamp(start):pd.Timestamp(end)]
 
 def _get_utc_timestamp_index(df):
     """ Construct a UTC timestamp index. """
@@ -1124,20 +1550,23 @@ def _drop_static_rows(df, data_type):
     """ Only keep rows where something has changed. """
     if not df.shape[0]:
         return df  # Empty data frame
-    else:
+    elif data_type in ['BID', 'ASK']:
         idx = np.zeros((df.shape[0],), dtype=bool)
         idx[0] = True
 
-        if data_type in ['BID', 'ASK']:
-            sub_df = df.drop(['average', 'barCount', 'volume'], axis=1)
-            vals = sub_df.to_numpy()
-            idx[1:] = np.any(vals[1:] != vals[:-1], axis=1)
-        elif data_type == 'TRADES':
-            # Only keep rows with a non-zero volume (e.g., a trade occurred in this bar)
-            idx[1:] = (df.volume.values[1:] != 0)
-        else:
-            raise NotImplementedError('Not implemented for data type {}'.format(data_type))
+        # Compare one column at a time, to avoid copying the prices into a 2-d array
+        changed = idx[1:]
+        for col in df.columns.difference(['average', 'barCount', 'volume'], sort=False):
+            vals = df[col].values
+            changed |= (vals[1:] != vals[:-1])
+        return df[idx]
+    elif data_type == 'TRADES':
+        # Only keep rows with a non-zero volume (e.g., a trade occurred in this bar)
+        idx = (df['volume'].values != 0)
+        idx[0] = True
         return df[idx]
+    else:
+        raise NotImplementedError('Not implemented for data type {}'.format(data_type))
 
 def _get_dataframe(df_input, start, end, data_type, 
                    timestamp=False, drop_empty_rows=True):
@@ -1154,11 +1583,9 @@ def _get_dataframe(df_input, start, end, data_type,
         #df.index = _get_utc_timestamp_index(df)
         raise NotImplementedError('Not implemented.')
     else:
-        df.set_index('date', inplace=True)
-        df.index = pd.DatetimeIndex(df.index)
-
-    # Sort by the index
-    df.sort_index(inplace=True)
+        # Set the index and sort by it
+        dates = pd.DatetimeIndex(df['date'].values, name='date')
+        df = df.drop(columns='date').set_index(dates).sort_index()
 
     # Restrict the output data to be between the start/end dates
     df = _restrict_to_start_end_dates(df, start, end, timestamp)
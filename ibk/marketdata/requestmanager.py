@@ -1,67 +1,93 @@
 import datetime
+import logging
 import time
-import queue
+import heapq
 import threading
 import collections
+import weakref
 from abc import ABC, abstractmethod
 
 import ibk.connect
 import ibk.errors
 
 import ibk.marketdata.constants as mdconst
+from ibk.marketdata.constants import (QUEUE_MONITORING, QUEUE_STREAM, QUEUE_GENERIC, QUEUE_SCANNER,
+                                      QUEUE_TICK_STREAM, QUEUE_HIST_SMALL_BAR, QUEUE_HIST_LARGE_BAR)
 import ibk.marketdata.datarequest
 from ibk.marketdata.restrictionmanager import RestrictionManager
 from ibk.marketdata.app import mktdata_manager
 
-# Define names of Queues used for managing data requests
-QUEUE_MONITORING = 'monitoring'
-QUEUE_STREAM = 'stream'
-QUEUE_GENERIC = 'generic'
-QUEUE_SCANNER = 'scanner'
-QUEUE_TICK_STREAM = 'tick_Stream'
-QUEUE_HIST_SMALL_BAR = 'hist_small_bar'
-QUEUE_HIST_LARGE_BAR = 'hist_large_bar'
-
+# Names of Queues used for managing data requests
 QUEUE_TYPES = [QUEUE_MONITORING, QUEUE_STREAM, QUEUE_GENERIC, QUEUE_SCANNER,
                QUEUE_TICK_STREAM, QUEUE_HIST_SMALL_BAR, QUEUE_HIST_LARGE_BAR]
 
 # Default timeout (in seconds) if IB does not provide a response to a request
 DEFAULT_TIMEOUT = 30
 
+# Number of seconds to wait for a placed request to be acknowledged before it is requeued
+REQUEST_PROPAGATION_TIMEOUT = 1.0
+
+# Number of seconds that a queue's thread waits for new requests before it exits
+QUEUE_IDLE_TIMEOUT = 5
+
+# Statuses of requests that no longer need to be monitored for a time out
+_FINISHED_STATUSES = frozenset((mdconst.STATUS_REQUEST_COMPLETE,
+                                mdconst.STATUS_REQUEST_CANCELLED,
+                                mdconst.STATUS_REQUEST_ERROR,))
+
+
+# Number of slots in the list of status change times. The list is indexed directly by
+#    the integer status codes, with the negative codes indexing slots from the end
+N_STATUS_SLOTS = len(mdconst.RequestStatusCode)
 
-# Create a class that will contain timestamps for any status changes
+
+# Create a class that will contain timestamps for any status changes.
+#    The timestamps come from time.monotonic(), so only differences between them are meaningful
 class RequestStatus:
+    __slots__ = ('object', 'info')
+
     def __init__(self, obj):
-        if not obj.status == mdconst.STATUS_REQUEST_NEW:
+        if not obj._status == mdconst.STATUS_REQUEST_NEW:
             raise ValueError('Expected new registered request to have status "new".')
         else:
             self.object = obj
-            self.info = {k : None for k in mdconst.STATUS_REQUEST_OPTIONS}
+            self.info = [None] * N_STATUS_SLOTS
             self.update()
 
     @property
     def status(self):
-        return self.object.status
+        return self.object._status
 
     def is_updated(self):
-        return self.info[self.status] is not None
+        return self.info[self.object._status] is not None
 
     def update(self):
-        if self.is_updated():
-            raise ValueError(f'Status {self.status} has already been set.')
+        info = self.info
+        status = self.object._status
+        if info[status] is not None:
+            raise ValueError(f'Unexpected attempt to record status {status}, which has already been set.')
         else:
-            self.info[self.status] = time.time()
+            info[status] = time.monotonic()
 
 
 class GlobalRequestManager:
-    # A map from unique Id to the DataRequest object
-    requests = dict()
-    
-    # Requests being tracked to ensure restrictions are enforced
-    restriction_manager = RestrictionManager()
+    def __init__(self):
+        # A map from unique Id to the DataRequest object
+        self.requests = dict()
+
+        # The unique Ids of the registered requests that are still active
+        self._active_ids = set()
+
+        # Requests being tracked to ensure restrictions are enforced
+        self.restriction_manager = RestrictionManager()
 
-    # Define request queues
-    queues = {q : None for q in QUEUE_TYPES}
+        # Define request queues
+        self.queues = {q : None for q in QUEUE_TYPES}
+        self._queues_lock = threading.Lock()
+
+        # Snapshot requests created by the factory functions, shared to avoid placing identical requests
+        self._inflight = weakref.WeakValueDictionary()
+        self._inflight_lock = threading.Lock()
 
     def place_request(self, reqObj, priority=0):
         """ Place a request with IB. """
@@ -70,22 +96,47 @@ class GlobalRequestManager:
         # Route the request to one of the request queues
         assigned_queue = self.get_assigned_queue(reqObj)
         assigned_queue.enqueue_request(reqObj, priority=priority)
-        
+
+    def place_requests(self, reqObjs, priority=0):
+        """ Place a batch of requests with IB.
+
+            All of the requests are validated before any of them are registered,
+            and each queue's thread is only checked once for the whole batch.
+        """
+        reqObjs = list(reqObjs)
+        for reqObj in reqObjs:
+            if reqObj._status != mdconst.STATUS_REQUEST_NEW:
+                raise ValueError(f'Only new requests can be placed. This request has status "{reqObj.status}."')
+
+        # Register all of the requests and group them by their assigned queue
+        batches = collections.defaultdict(list)
+        for reqObj in reqObjs:
+            self._register_new_request(reqObj)
+            batches[self.get_assigned_queue(reqObj)].append(reqObj)
+
+        for assigned_queue, batch in batches.items():
+            assigned_queue.enqueue_requests(batch, priority=priority)
+
     @property
     def monitoring_queue(self):
         return self.get_queue(QUEUE_MONITORING)
             
     def get_queue(self, tag):
         """ Get a specific DataRequestQueue. """
-        if tag not in self.queues:
+        queue = self.queues.get(tag, None)
+        if queue is not None:
+            return queue
+        elif tag not in self.queues:
             raise ValueError(f'Unsupported queue name: "{tag}".')
-        elif tag == QUEUE_MONITORING:
-            if self.queues[tag] is None:
-                self.queues[tag] = MonitoringQueue(self, timeout=DEFAULT_TIMEOUT)
-            return self.queues[tag]            
-        else:
+
+        # Create the queue the first time it is needed, making sure that
+        #    concurrent requests do not create more than one instance
+        with self._queues_lock:
             if self.queues[tag] is None:
-                self.queues[tag] = DataRequestQueue(self, name=tag)
+                if tag == QUEUE_MONITORING:
+                    self.queues[tag] = MonitoringQueue(self, timeout=DEFAULT_TIMEOUT)
+                else:
+                    self.queues[tag] = DataRequestQueue(self, name=tag)
             return self.queues[tag]
 
     def cancel_request(self, reqObj):
@@ -93,20 +144,36 @@ class GlobalRequestManager:
         app = self._get_app()
         reqObj._cancel_request_with_ib(app)
 
+    def _release_shared_request(self, reqObj):
+        """ Release one caller's share of a request that is cancelled.
+
+            Returns True if other callers are still using the request, in which
+            case the request should not be cancelled with IB.
+        """
+        with self._inflight_lock:
+            if reqObj._n_callers > 1:
+                reqObj._n_callers -= 1
+                return True
+            else:
+                return False
+
     def update_status(self, uniq_id):
         """ Record the time of any change in status.
         """
-        reqObj = self.requests[uniq_id].object
-        if not self.requests[uniq_id].is_updated():
-            self.requests[uniq_id].update()
-        else:
-            raise ValueError('Unexpected attempt to record a status change that has already occured.')
+        req_status = self.requests[uniq_id]
+
+        # This raises if the change in status has already been recorded
+        req_status.update()
+
+        reqObj = req_status.object
+        if not reqObj.is_active():
+            self._active_ids.discard(uniq_id)
 
         self.restriction_manager.update_status(reqObj)
 
     def get_active_requests(self):
         """ Return a list of requests that are still active. """
-        return list([reqStatus.object for reqStatus in self.requests.values() if reqStatus.object.is_active()]) 
+        return [self.requests[uniq_id].object for uniq_id in list(self._active_ids)]
         
     def _register_new_request(self, reqObj):
         """ Save the details of a new request.
@@ -115,24 +182,34 @@ class GlobalRequestManager:
         app = self._get_app()        
         reqObj.req_id = app._get_next_req_id()
 
-        # Check that we are not re-registering an old request with the App (this should never happen)
-        if reqObj.req_id in app.requests:
-            raise ValueError(f'The request req_id {reqObj.req_id} has already been registered.')
-        else:
-            app.requests[reqObj.req_id] = reqObj
+        # Register the request with the App (this raises if the req_id has already been registered)
+        app.register_request(reqObj)
 
         # Check that we are not re-registering an old request with the Request Manager (this should never happen)
         if reqObj.uniq_id in self.requests:
             raise ValueError(f'The request uniq_id {reqObj.uniq_id} has already been registered.')
         else:
             self.requests[reqObj.uniq_id] = RequestStatus(reqObj)
+            self._active_ids.add(reqObj.uniq_id)
         
         # Update the request status
-        reqObj.status = mdconst.STATUS_REQUEST_QUEUED
+        reqObj._set_status(mdconst.STATUS_REQUEST_QUEUED)
+
+    def _register_cached_request(self, reqObj):
+        """ Record a request whose data was loaded from the cache, so it is never sent to IB.
+        """
+        if reqObj.uniq_id in self.requests:
+            raise ValueError(f'The request uniq_id {reqObj.uniq_id} has already been registered.')
+        else:
+            self.requests[reqObj.uniq_id] = RequestStatus(reqObj)
+
+        # Record the completion of the request
+        reqObj._set_status(mdconst.STATUS_REQUEST_COMPLETE)
 
     def _deregister_request(self, reqObj):
         if reqObj.uniq_id in self.requests:
             del self.requests[reqObj.uniq_id]
+        self._active_ids.discard(reqObj.uniq_id)
 
     def _get_app(self):
         """ Get an App instance from the MarketDataAppManager. """
@@ -143,34 +220,7 @@ class GlobalRequestManager:
         
             This assignment will be based on the type of DataRequest being made.
         """
-        if isinstance(reqObj, ibk.marketdata.datarequest.HistoricalDataRequest):
-            if not reqObj.is_snapshot:
-                tag = QUEUE_STREAM
-            elif reqObj.is_small_bar:
-                tag = QUEUE_HIST_SMALL_BAR
-            else:
-                tag = QUEUE_HIST_LARGE_BAR
-        elif isinstance(reqObj, ibk.marketdata.datarequest.HistoricalTickDataRequest):
-            tag = QUEUE_HIST_SMALL_BAR
-        elif isinstance(reqObj, ibk.marketdata.datarequest.StreamingBarRequest):
-            tag = QUEUE_STREAM
-        elif isinstance(reqObj, (ibk.marketdata.datarequest.FundamentalDataRequest,
-                                 ibk.marketdata.datarequest.HeadTimeStampDataRequest,
-                                 ibk.marketdata.datarequest.ScannerParametersDataRequest,)):
-            tag = QUEUE_GENERIC
-        elif isinstance(reqObj, ibk.marketdata.datarequest.ScannerDataRequest):
-            tag = QUEUE_SCANNER
-        elif isinstance(reqObj, ibk.marketdata.datarequest.MarketDataRequest):
-            if not reqObj.is_snapshot:
-                tag = QUEUE_STREAM
-            else:
-                tag = QUEUE_GENERIC
-        elif isinstance(reqObj, ibk.marketdata.datarequest.StreamingTickDataRequest):
-            tag = QUEUE_TICK_STREAM
-        else:
-            raise ValueError(f'Unsupported data request class: {reqObj.__class__}')
-
-        return self.get_queue(tag)
+        return self.get_queue(reqObj.queue_tag)
 
 
 class DataRequestQueue:
@@ -178,15 +228,24 @@ class DataRequestQueue:
         self.request_manager = request_manager
         self.name = name
 
-        self.queue = queue.PriorityQueue()
-        self.thread = None
+        # The queued requests are kept in a heap, and the condition is used to
+        #    wake the thread when new requests arrive
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # The app used to place requests, which is replaced if its connection is lost
+        self._app = None
 
         self.counter = 0
         self.n_timeouts = 0
         self.max_timeouts = 3
 
     def _get_app(self):
-        return self.request_manager._get_app()
+        app = self._app
+        if app is None or not app.isConnected():
+            app = self._app = self.request_manager._get_app()
+        return app
 
     @property
     def restriction_manager(self):
@@ -194,17 +253,14 @@ class DataRequestQueue:
 
     @property
     def thread(self):
-        if self._thread is None or not self._thread.is_alive():
-            self._thread = threading.Thread(name=f'DataRequestQueue-{self.name}',
-                                            target=self._process_requests)
-            self._thread.start()
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(name=f'DataRequestQueue-{self.name}',
+                                                target=self._process_requests)
+                self._thread.start()
 
-        return self._thread
+            return self._thread
 
-    @thread.setter
-    def thread(self, t):
-        self._thread = t
-    
     def enqueue_request(self, reqObj, priority=0):
         """ Put a request in a queue to be processed. 
         
@@ -213,14 +269,35 @@ class DataRequestQueue:
                 priority: (float) the requests with the lowest priority
                     will be processed first.
         """
-        self.queue.put((priority, reqObj))
-        reqObj.status = mdconst.STATUS_REQUEST_QUEUED
+        self.enqueue_requests([reqObj], priority=priority)
+
+    def enqueue_requests(self, reqObjs, priority=0):
+        """ Put a batch of requests in a queue to be processed. """
+        for reqObj in reqObjs:
+            reqObj._set_status(mdconst.STATUS_REQUEST_QUEUED)
 
-        # Make sure there is a live version of the thread
-        _ = self.thread
+        with self._cond:
+            for reqObj in reqObjs:
+                heapq.heappush(self._heap, (priority, reqObj.uniq_id, reqObj))
+
+            # Make sure there is a live version of the thread, and wake it up
+            _ = self.thread
+            self._cond.notify()
 
     def qsize(self):
-        return self.queue.qsize()
+        return len(self._heap)
+
+    def _get_next_request(self):
+        """ Wait for the next request in the queue.
+
+            Returns None (and releases the thread) if no request arrives within the idle timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._heap, timeout=QUEUE_IDLE_TIMEOUT):
+                self._thread = None
+                return None
+            else:
+                return heapq.heappop(self._heap)
 
     def _process_requests(self):
         """ The target function run by the thread to process requests in the queue.
@@ -232,44 +309,54 @@ class DataRequestQueue:
                            mdconst.STATUS_REQUEST_CANCELLED,
                            mdconst.STATUS_REQUEST_ERROR,
                           ]
-        while self.queue.qsize():
-            priority, reqObj = self.queue.get(timeout=0.001)
+        while True:
+            next_request = self._get_next_request()
+            if next_request is None:
+                break
+            else:
+                priority, _, reqObj = next_request
+
+            # A bad request is logged and skipped, so that it does not stop
+            #    the thread from processing the requests queued behind it
             is_valid, msg = reqObj.is_valid_request()
             if not is_valid:
-                # Check that this is a valid request
-                raise ibk.errors.DataRequestError(msg)
-            elif reqObj.status != mdconst.STATUS_REQUEST_QUEUED:
-                app = self._get_app()
+                logging.error(f'{self.__class__}:_process_requests:Invalid request:{msg}:{reqObj.uniq_id}')
+                reqObj._set_status(mdconst.STATUS_REQUEST_ERROR)
+                continue
+            elif reqObj._status != mdconst.STATUS_REQUEST_QUEUED:
                 error_message = 'Unexpected status: this request is no longer queued.'
-                app.logger.error(f'{self.__class__}:_process_requests:{error_message}:{reqObj.status}:{reqObj.__dict__}')
-                raise ValueError(error_message)
+                logging.error(f'{self.__class__}:_process_requests:{error_message}:{reqObj.status}:{reqObj.uniq_id}')
+                continue
             else:
-                reqObj.status = mdconst.STATUS_REQUEST_PROCESSING
+                reqObj._set_status(mdconst.STATUS_REQUEST_PROCESSING)
 
             # Sleep until ready to process this request.
             self._wait_until_ready(reqObj)
 
             # Place the request
             app = self._get_app()
-            reqObj._place_request_with_ib(app)
+            try:
+                reqObj._place_request_with_ib(app)
+            except Exception:
+                logging.exception(f'{self.__class__}:_process_requests:Failed to place request:{reqObj.uniq_id}')
+                reqObj._set_status(mdconst.STATUS_REQUEST_ERROR)
+                continue
 
             # Put the request onto the monitoring queue to make sure it gets fulfilled
             self.request_manager.monitoring_queue.enqueue_request(reqObj, priority=priority)
 
             # Wait for request to propogate
-            wait_time = 1.0
-            t0 = time.time()
-            if time.time() - t0 < wait_time and reqObj.status not in finished_status:
-                time.sleep(0.05)
+            reqObj._done_event.wait(timeout=REQUEST_PROPAGATION_TIMEOUT)
 
             # Re-queue the request if it timed out
-            if reqObj.status not in finished_status:
+            if reqObj._status not in finished_status:
                 # Handle the case where the request timed out
-                # Reset the request instance to its original settings, and add it back to the queue
-                reqObj.cancel_request()
+                # Reset the request instance to its original settings, and place it again so that
+                #    it is re-registered (with a new req_id) before it goes back on the queue
+                self.request_manager.cancel_request(reqObj)
                 reqObj.reset()
-                print(f'Requeueing request {reqObj.uniq_id}...')
-                self.enqueue_request(reqObj, priority=priority)
+                logging.warning(f'{self.__class__}:_process_requests:Requeueing request:{reqObj.uniq_id}')
+                self.request_manager.place_request(reqObj, priority)
                 self.n_timeouts += 1
             else:
                 self.counter += 1
@@ -277,20 +364,19 @@ class DataRequestQueue:
 
             # If we have timed out too many consecutive times, try disconnecting and reconnecting 
             if self.n_timeouts > self.max_timeouts:
-                print('Reconnecting App...')
-                app.disconnect()
+                logging.warning(f'{self.__class__}:_process_requests:Reconnecting App:{self.name}')
                 self.n_timeouts = 0
-
-        # Get rid of the finished thread
-        self.thread = None
+                try:
+                    app.restart_connection(force=True)
+                except (ibk.errors.ConnectionNotEstablishedError, ibk.errors.DuplicatedThreadName):
+                    # Use a different app for the next request
+                    logging.exception(f'{self.__class__}:_process_requests:Reconnect failed:{self.name}')
+                    self._app = None
 
     def _wait_until_ready(self, reqObj):
-        """ Function that holds the request (sleeps) until ready to send it to IB.
+        """ Function that holds the request until ready to send it to IB.
         """
-        is_satisfied = self.restriction_manager.check_is_satisfied(reqObj)
-        while not all(is_satisfied.values()):
-            time.sleep(0.1)
-            is_satisfied = self.restriction_manager.check_is_satisfied(reqObj)
+        self.restriction_manager.wait_until_satisfied(reqObj)
 
 
 class MonitoringQueue:
@@ -303,8 +389,12 @@ class MonitoringQueue:
             self.timeout = timeout
 
         self.name = QUEUE_MONITORING
-        self.queue = queue.Queue()
-        self.thread = None
+
+        # The requests are kept in a heap ordered by the time at which they will time out,
+        #    so the thread only needs to wake up when the next deadline is reached
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
         self.counter = 0
 
     def _get_app(self):
@@ -316,16 +406,13 @@ class MonitoringQueue:
 
     @property
     def thread(self):
-        if self._thread is None or not self._thread.is_alive():
-            self._thread = threading.Thread(name=f'DataRequestQueue-{self.name}',
-                                            target=self._process_requests)
-            self._thread.start()
-
-        return self._thread
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(name=f'DataRequestQueue-{self.name}',
+                                                target=self._process_requests)
+                self._thread.start()
 
-    @thread.setter
-    def thread(self, t):
-        self._thread = t
+            return self._thread
 
     def enqueue_request(self, reqObj, priority=0):
         """ Put a request in a queue to be processed. 
@@ -337,54 +424,71 @@ class MonitoringQueue:
         """
         if reqObj.n_restarts > reqObj.max_restarts:
             raise ValueError(f'Maximum restarts exceeded for request {reqObj.uniq_id}.')
-        
-        self.queue.put((priority, reqObj))
 
-        # Make sure there is a live version of the thread
-        _ = self.thread
+        # Get the time that the request was placed
+        t_0 = self.request_manager.requests[reqObj.uniq_id].info[mdconst.STATUS_REQUEST_SENT_TO_IB]
+        if t_0 is None:
+            t_0 = time.monotonic()
+
+        with self._cond:
+            heapq.heappush(self._heap, (t_0 + self.timeout, priority, reqObj.uniq_id, reqObj))
+
+            # Make sure there is a live version of the thread, and wake it up
+            _ = self.thread
+            self._cond.notify()
 
     def qsize(self):
-        return self.queue.qsize()
+        return len(self._heap)
+
+    def _get_next_timed_out_request(self):
+        """ Wait until the request with the earliest deadline times out.
+
+            Requests that have finished or returned data before their deadline are dropped.
+            Returns None (and releases the thread) if the queue stays empty for the idle timeout.
+        """
+        with self._cond:
+            while True:
+                if not self._cond.wait_for(lambda: self._heap, timeout=QUEUE_IDLE_TIMEOUT):
+                    self._thread = None
+                    return None
+
+                deadline, priority, _, reqObj = self._heap[0]
+                if reqObj._status in _FINISHED_STATUSES or reqObj.has_data():
+                    # The request was completed/cancelled or has returned data
+                    heapq.heappop(self._heap)
+                    self.counter += 1
+                else:
+                    wait_time = deadline - time.monotonic()
+                    if wait_time > 0:
+                        # Sleep until the deadline (or until a request with an earlier deadline arrives)
+                        self._cond.wait(timeout=wait_time)
+                    else:
+                        heapq.heappop(self._heap)
+                        return priority, reqObj
 
     def _process_requests(self):
         """ The target function run by the thread to process requests in the queue.
         
             This should be defined by the subclass in order to process requests.
         """
-        finished_status = (mdconst.STATUS_REQUEST_COMPLETE, 
-                           mdconst.STATUS_REQUEST_CANCELLED,
-                           mdconst.STATUS_REQUEST_ERROR,)
-        while self.queue.qsize():
-            priority, reqObj = self.queue.get(timeout=0.001)
-
-            # Check if the request was completed/cancelled or has returned any data
-            if reqObj.status not in finished_status and not reqObj.has_data():
-
-                # Get the time that the request was placed
-                t_0 = self.request_manager.requests[reqObj.uniq_id].info[mdconst.STATUS_REQUEST_SENT_TO_IB]
-
-                # Check if the max wait time has been exceedeed
-                if time.time() - t_0 > self.timeout:
-                    # Cancel the request, as it has timed out
-                    reqObj.cancel_request()
-                    if reqObj.n_restarts == reqObj.max_restarts:
-                        # If we have already exceeded our allowed restarts, then cancel the request
-                        reqObj.status = mdconst.STATUS_REQUEST_TIMED_OUT
-                    else:
-                        # ...otherwise try to place the request once again
-                        N = reqObj.n_restarts
-                        reqObj.reset()
-                        reqObj.n_restarts = N + 1
-                        self.request_manager.place_request(reqObj, priority)
-                else:
-                    # We haven't timed out yet, so put the request back on the queue and wait longer
-                    self.queue.put((priority, reqObj))
-            
-            # Sleep after checking each request so we don't use too much CPU rechecking requests
-            time.sleep(1)
+        while True:
+            next_request = self._get_next_timed_out_request()
+            if next_request is None:
+                break
+            else:
+                priority, reqObj = next_request
 
-        # Get rid of the finished thread
-        self.thread = None
+            # Cancel the request, as it has timed out
+            self.request_manager.cancel_request(reqObj)
+            if reqObj.n_restarts == reqObj.max_restarts:
+                # If we have already exceeded our allowed restarts, then cancel the request
+                reqObj._set_status(mdconst.STATUS_REQUEST_TIMED_OUT)
+            else:
+                # ...otherwise try to place the request once again
+                N = reqObj.n_restarts
+                reqObj.reset()
+                reqObj.n_restarts = N + 1
+                self.request_manager.place_request(reqObj, priority)
 
 
 # Define a global version of the request manager
@@ -1,245 +1,237 @@
-import ibk.marketdata.constants as mdconst
 import collections
+import contextlib
 import time
-import queue
 import threading
 
-import ibk.marketdata.constants as mdconst
+from ibk.marketdata.constants import (RESTRICTION_CLASSES, RESTRICTION_CLASS_SIMUL_HIST,
+                                      RESTRICTION_CLASS_SIMUL_SCANNERS, RESTRICTION_CLASS_SIMUL_STREAMS,
+                                      RESTRICTION_CLASS_SIMUL_TICK_STREAMS, RESTRICTION_CLASS_HF_HIST_IDENTICAL,
+                                      RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW, RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
+                                      RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT, STATUS_REQUEST_SENT_TO_IB,
+                                      STATUS_REQUEST_COMPLETE, STATUS_REQUEST_CANCELLED, STATUS_REQUEST_ERROR,
+                                      STATUS_REQUEST_TIMED_OUT)
 
 
 # Maximum number of allowed simultaneous requests
 MAX_SIMUL_REQUESTS = {
-    mdconst.RESTRICTION_CLASS_SIMUL_HIST : 2, # 50      # Max # of simultaneous historical data requests
-    mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS : 10,      # Max # of simultaneous market scanners
-    mdconst.RESTRICTION_CLASS_SIMUL_STREAMS : 100,      # Max # of simultaneous market data streams (aka lines)
-    mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS : 5,   # Max # of simultaneous tick data streams
+    RESTRICTION_CLASS_SIMUL_HIST : 2, # 50      # Max # of simultaneous historical data requests
+    RESTRICTION_CLASS_SIMUL_SCANNERS : 10,      # Max # of simultaneous market scanners
+    RESTRICTION_CLASS_SIMUL_STREAMS : 100,      # Max # of simultaneous market data streams (aka lines)
+    RESTRICTION_CLASS_SIMUL_TICK_STREAMS : 5,   # Max # of simultaneous tick data streams
 }
 
 # Limits to number of requests in window - (# requests per window, seconds per window)
 MAX_REQUESTS_PER_WINDOW = {
-    mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL : (1, 15),          # no. allowed identical requests
-    mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW : (6, 2),        # no. requests allowed on 1 contract
-    mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW : (60, 600),      # total # of requests allowed
-    mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT : (1, 15),  # no. tick stream requests allowed on 1 contract
+    RESTRICTION_CLASS_HF_HIST_IDENTICAL : (1, 15),          # no. allowed identical requests
+    RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW : (6, 2),        # no. requests allowed on 1 contract
+    RESTRICTION_CLASS_HF_HIST_LONG_WINDOW : (60, 600),      # total # of requests allowed
+    RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT : (1, 15),  # no. tick stream requests allowed on 1 contract
 }
 
+# Length of each request window in nanoseconds, for comparison with the entry times from time.monotonic_ns()
+_WINDOW_NS = {res_class: int(T * 1e9) for res_class, (_, T) in MAX_REQUESTS_PER_WINDOW.items()}
 
-class RestrictionManager:
-    requests = dict()
-    
-    # Define a set of containers to store the current set of historical / open requests
-    restrictions = {
-        mdconst.RESTRICTION_CLASS_SIMUL_HIST :
-            dict(),
-        mdconst.RESTRICTION_CLASS_SIMUL_STREAMS :
-            dict(),
-        mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS :
-            dict(),
-        mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS :
-            dict(),
-        mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW :
-            queue.PriorityQueue(maxsize=\
-                    -1 + MAX_REQUESTS_PER_WINDOW[mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW][0]),
-        mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW :
-            collections.defaultdict(lambda :
-                queue.PriorityQueue(maxsize=\
-                    -1 + MAX_REQUESTS_PER_WINDOW[mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW][0])),
-        mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL :
-            collections.defaultdict(lambda :
-                queue.PriorityQueue(maxsize=\
-                    -1 + MAX_REQUESTS_PER_WINDOW[mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL][0])),
-        mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT :
-            collections.defaultdict(lambda :
-                queue.PriorityQueue(maxsize=\
-                    -1 + MAX_REQUESTS_PER_WINDOW[mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT][0])),
-    }
-    
-    # Define a set of threading locks to prevent race conditions when accessing shared resources
-    locks = {res_class : threading.Lock() for res_class in mdconst.RESTRICTION_CLASSES}
+# Maximum number of requests allowed for each restriction class (at once, or within its window)
+_REQUEST_LIMITS = {**MAX_SIMUL_REQUESTS,
+                   **{res_class: n for res_class, (n, _) in MAX_REQUESTS_PER_WINDOW.items()}}
+
+# Restriction classes that limit the number of open requests
+_SIMUL_RESTRICTION_CLASSES = frozenset(MAX_SIMUL_REQUESTS)
+
+# Restriction classes with a separate container (and lock) for each contract or distinct request
+_KEYED_RESTRICTION_CLASSES = frozenset((RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
+                                        RESTRICTION_CLASS_HF_HIST_IDENTICAL,
+                                        RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,))
+
+# Maximum number of seconds to wait before re-checking the restrictions on a request
+MAX_RESTRICTION_WAIT = 1.0
 
+# Statuses of requests that no longer count towards the simultaneous request limits
+_CLOSED_STATUSES = frozenset((STATUS_REQUEST_COMPLETE,
+                              STATUS_REQUEST_CANCELLED,
+                              STATUS_REQUEST_ERROR,
+                              STATUS_REQUEST_TIMED_OUT,))
+
+
+class RestrictionManager:
     def __init__(self):
-        self.restriction_class_handler = {
-            mdconst.RESTRICTION_CLASS_SIMUL_HIST :
-                self._check_simultaneous_historical_requests,
-            mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS :
-                self._check_simultaneous_scanners,
-            mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS :
-                self._check_simultaneous_tick_streams,
-            mdconst.RESTRICTION_CLASS_SIMUL_STREAMS :
-                self._check_simultaneous_streams,
-            mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL :
-                self._check_identical_historical_requests,
-            mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW :
-                self._check_historical_requests_on_same_contract,
-            mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW :
-                self._check_too_many_historical_requests,
-            mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT :
-                self._check_tick_streams_on_same_contract,
-        }        
-    
+        # Define a set of containers to store the current set of historical / open requests
+        self.restrictions = {
+            RESTRICTION_CLASS_SIMUL_HIST :
+                set(),
+            RESTRICTION_CLASS_SIMUL_STREAMS :
+                set(),
+            RESTRICTION_CLASS_SIMUL_SCANNERS :
+                set(),
+            RESTRICTION_CLASS_SIMUL_TICK_STREAMS :
+                set(),
+            RESTRICTION_CLASS_HF_HIST_LONG_WINDOW :
+                collections.deque(),
+            RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW :
+                collections.defaultdict(collections.deque),
+            RESTRICTION_CLASS_HF_HIST_IDENTICAL :
+                collections.defaultdict(collections.deque),
+            RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT :
+                collections.defaultdict(collections.deque),
+        }
+
+        # Define a set of threading locks to prevent race conditions when accessing shared resources
+        self.locks = {res_class : threading.Lock() for res_class in RESTRICTION_CLASSES}
+
+        # Containers that are kept per contract have their own locks, so that
+        #    requests on unrelated contracts do not block each other
+        self.keyed_locks = {res_class : collections.defaultdict(threading.Lock)
+                                for res_class in _KEYED_RESTRICTION_CLASSES}
+
+        # Used to wake up threads that are waiting for restrictions to be lifted
+        self._cond = threading.Condition()
+
     def get_container(self, reqObj, res_class):
         """ Get the container pertaining to a particular restriction class. 
          
-            Make sure the container is up-to-date by removing closed/cancelled requests.
+            Open requests are removed from their containers when they are closed, and
+            the windowed containers are brought up-to-date by removing expired requests.
         """
         container = self.restrictions.get(res_class, None)
 
-        if res_class in (mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-                         mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT):
-            # There are separate containers for each contract
-            container = container[reqObj.contract.localSymbol]
-        elif res_class == mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL:
-            # Get a unique key to represent distinct data requests
-            key = '{}_{}'.format(reqObj.__class__.__name__, reqObj.contract.localSymbol)
-            for attr in ['start', 'end', 'frequency']:
-                if hasattr(reqObj, attr):
-                    key = key + '_' + str(reqObj.__getattribute__(attr))
-
-            # Each unique request lives in its own container
-            container = container[key]
+        if res_class in _KEYED_RESTRICTION_CLASSES:
+            container = container[self._get_container_key(reqObj, res_class)]
 
         if container is None:
-            raise ValueError(f'Unknown restriction class: "{res_class}".')        
-        elif res_class in (mdconst.RESTRICTION_CLASS_SIMUL_HIST,
-                           mdconst.RESTRICTION_CLASS_SIMUL_STREAMS,
-                           mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS,
-                           mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS):
-
-            # Remove requests that are no longer open
-            uniq_ids = list(container.keys())
-            for uniq_id in uniq_ids:
-                reqObj = container[uniq_id]
-                if reqObj.status != mdconst.STATUS_REQUEST_SENT_TO_IB:
-                    del container[uniq_id]
-        elif res_class in (mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
-                           mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-                           mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL,
-                           mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT):
-            # Get the number of seconds in a window
-            T_max = MAX_REQUESTS_PER_WINDOW[res_class][1]
-            
-            # Remove old requests that no longer have an effect on throttling
-            up_to_date = False
-            while container.qsize() and not up_to_date:
-                T, uniq_id = container.get()
-                if time.time() - T < T_max:
-                    up_to_date = True
-                    container.put((T, uniq_id))
+            raise ValueError(f'Unknown restriction class: "{res_class}".')
+
+        window_ns = _WINDOW_NS.get(res_class, None)
+        if window_ns is not None:
+            # Remove old requests that no longer have an effect on throttling.
+            #    Entries are appended in time order, so the oldest is always on the left.
+            t_expired = time.monotonic_ns() - window_ns
+            while container and container[0][0] <= t_expired:
+                container.popleft()
 
         return container
 
+    def _get_container_key(self, reqObj, res_class):
+        """ Get the key of the container (and lock) used for a request in a keyed restriction class.
+
+            The keys are cached on the request, as they are needed for every check, register and deregister.
+        """
+        key = reqObj._restriction_keys.get(res_class, None)
+        if key is None:
+            if res_class == RESTRICTION_CLASS_HF_HIST_IDENTICAL:
+                # Each distinct request has its own container
+                key = reqObj.identical_key
+            else:
+                # There are separate containers for each contract
+                key = reqObj.contract.localSymbol
+            reqObj._restriction_keys[res_class] = key
+        return key
+
+    def _get_lock(self, reqObj, res_class):
+        """ Get the lock protecting the container used for a request in a restriction class. """
+        if res_class in _KEYED_RESTRICTION_CLASSES:
+            return self.keyed_locks[res_class][self._get_container_key(reqObj, res_class)]
+        else:
+            return self.locks[res_class]
+
     def update_status(self, reqObj):
-        if reqObj.status == mdconst.STATUS_REQUEST_SENT_TO_IB:
+        if reqObj._status == STATUS_REQUEST_SENT_TO_IB:
             self._register(reqObj)
-        elif reqObj.status in [mdconst.STATUS_REQUEST_COMPLETE,
-                               mdconst.STATUS_REQUEST_CANCELLED]:
+        elif reqObj._status in _CLOSED_STATUSES:
             self._deregister(reqObj)
+
+            # Wake up any threads waiting for an open request to finish
+            with self._cond:
+                self._cond.notify_all()
         else:
             pass  # Nothing to do here
 
+    def wait_until_satisfied(self, reqObj):
+        """ Block until all of the restrictions on a request are satisfied.
+
+            The waiting thread wakes up when an open request finishes, or when
+            the oldest entry in one of the request windows expires.
+        """
+        with self._cond:
+            while not self.all_satisfied(reqObj):
+                self._cond.wait(timeout=self._get_time_to_next_expiry(reqObj))
+
+    def _get_time_to_next_expiry(self, reqObj):
+        """ Get the number of seconds until the oldest entry in one of the request's windows expires. """
+        wait_time = MAX_RESTRICTION_WAIT
+        for res_class in reqObj.restriction_class:
+            if res_class in _WINDOW_NS:
+                with self._get_lock(reqObj, res_class):
+                    entries = self.get_container(reqObj, res_class)
+                    if entries:
+                        t_remaining = entries[0][0] + _WINDOW_NS[res_class] - time.monotonic_ns()
+                        wait_time = min(wait_time, t_remaining / 1e9)
+        return max(wait_time, 0)
+
     def check_is_satisfied(self, reqObj):
-        result = dict()
+        with self._lock_all(reqObj):
+            return {res_class : self._check_single_restriction(reqObj, res_class)
+                        for res_class in reqObj.restriction_class}
+
+    def all_satisfied(self, reqObj):
+        """ Return True if all of the restrictions on a request are satisfied.
+
+            Stops at the first restriction that is not satisfied.
+        """
         for res_class in reqObj.restriction_class:
-            lock = self.locks[res_class]
-            with lock:
-                result[res_class] = self._check_single_restriction(reqObj, res_class)                
-        return result
+            with self._get_lock(reqObj, res_class):
+                if not self._check_single_restriction(reqObj, res_class):
+                    return False
+        return True
+
+    def _lock_all(self, reqObj):
+        """ Acquire the locks for all of a request's restriction classes, and return a context manager that releases them.
+
+            The locks are always acquired in order of restriction class, to avoid deadlocks between threads.
+        """
+        with contextlib.ExitStack() as stack:
+            for res_class in sorted(reqObj.restriction_class):
+                stack.enter_context(self._get_lock(reqObj, res_class))
+            return stack.pop_all()
 
     def _register(self, reqObj):
-        for res_class in reqObj.restriction_class:
-            lock = self.locks[res_class]
-            with lock:            
+        with self._lock_all(reqObj):
+            for res_class in reqObj.restriction_class:
                 self._register_single(reqObj, res_class)
 
     def _deregister(self, reqObj):
-        for res_class in reqObj.restriction_class:
-            lock = self.locks[res_class]
-            with lock:            
+        with self._lock_all(reqObj):
+            for res_class in reqObj.restriction_class:
                 self._deregister_single(reqObj, res_class)
 
     def _register_single(self, reqObj, res_class):        
         container = self.get_container(reqObj, res_class)
 
-        if res_class in (mdconst.RESTRICTION_CLASS_SIMUL_HIST,
-                         mdconst.RESTRICTION_CLASS_SIMUL_STREAMS,
-                         mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS,
-                         mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS):
-            # Using a 'set' object
+        if res_class in _SIMUL_RESTRICTION_CLASSES:
+            # Using a 'set' object, which holds the uniq_id of each open request.
+            #    Only membership is needed, so the container does not hold on to the request objects.
             if reqObj.uniq_id in container:
-                raise ValueError(f'Did not expect to find uniq_id already registered: {uniq_id}.')
+                raise ValueError(f'Did not expect to find uniq_id already registered: {reqObj.uniq_id}.')
             else:
-                container[reqObj.uniq_id] = reqObj
-        elif res_class in (mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
-                           mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-                           mdconst.RESTRICTION_CLASS_TICK_STREAM_SAME_CONTRACT,):
-            # Using a 'PriorityQueue' object
-            entry = (time.time(), reqObj.uniq_id)
-            container.put(entry)
-            if reqObj.data_type == 'BID_ASK':
-                container.put(entry)  # Getting 'BID_ASK' counts as 2 requests for IB
-        elif res_class == mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL:
-            entry = (time.time(), reqObj.uniq_id)
-            container.put(entry)
+                container.add(reqObj.uniq_id)
+        else:
+            # Using a 'deque' object
+            entry = (time.monotonic_ns(), reqObj.uniq_id)
+            container.append(entry)
+            if res_class != RESTRICTION_CLASS_HF_HIST_IDENTICAL and reqObj.data_type == 'BID_ASK':
+                container.append(entry)  # Getting 'BID_ASK' counts as 2 requests for IB
 
     def _deregister_single(self, reqObj, res_class):
-        container = self.get_container(reqObj, res_class)
-
-        if res_class in (mdconst.RESTRICTION_CLASS_SIMUL_HIST,
-                         mdconst.RESTRICTION_CLASS_SIMUL_STREAMS,
-                         mdconst.RESTRICTION_CLASS_SIMUL_SCANNERS,
-                         mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS):
+        if res_class in _SIMUL_RESTRICTION_CLASSES:
             # If the request has not already been removed from the container, then delete it
-            if reqObj.uniq_id in container:
-                del container[reqObj.uniq_id]
-        elif res_class in (mdconst.RESTRICTION_CLASS_HF_HIST_LONG_WINDOW,
-                           mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW,
-                           mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL,
-                           mdconst.RESTRICTION_CLASS_SIMUL_TICK_STREAMS):
-            pass # Nothing to deregister for historical request
+            self.get_container(reqObj, res_class).discard(reqObj.uniq_id)
+        else:
+            pass # Nothing to deregister for windowed restrictions, whose entries expire
 
     def _check_single_restriction(self, reqObj, res_class):
         """ Function that checks if a single restriction is resolved.
         """
-        res_fun_handle = self.restriction_class_handler.get(res_class, None)
-        if res_class is None:
+        limit = _REQUEST_LIMITS.get(res_class, None)
+        if limit is None:
             raise ValueError(f'Unknown restriction class: "{res_class}".')
         else:
-            res_fun_handle = self.restriction_class_handler[res_class]
-            return res_fun_handle(reqObj, res_class)
-
-    def _check_simultaneous_historical_requests(self, reqObj, res_class):
-        container = self.get_container(reqObj, res_class)
-        return len(container) < MAX_SIMUL_REQUESTS[res_class]
-
-    def _check_simultaneous_streams(self, reqObj, res_class):
-        container = self.get_container(reqObj, res_class)
-        return len(container) < MAX_SIMUL_REQUESTS[res_class]
-
-    def _check_simultaneous_scanners(self, reqObj, res_class):
-        container = self.get_container(reqObj, res_class)
-        return len(container) < MAX_SIMUL_REQUESTS[res_class]
-
-    def _check_simultaneous_tick_streams(self, reqObj, res_class):
-        container = self.get_container(reqObj, res_class)
-        return len(container) < MAX_SIMUL_REQUESTS[res_class]
-
-    def _check_too_many_historical_requests(self, reqObj, res_class):
-        """  Check if rate of historical high freq. requests is too high. """
-        container = self.get_container(reqObj, res_class)
-        return not container.full()
-
-    def _check_identical_historical_requests(self, reqObj, res_class):
-        """ Check identical historical small bar requests. """
-        container = self.get_container(reqObj, res_class)
-        return not container.full()
-
-    def _check_historical_requests_on_same_contract(self, reqObj, res_class):
-        """ Check if historical requests on same contract are too frequent. """
-        container = self.get_container(reqObj, res_class)
-        return not container.full()
-
-    def _check_tick_streams_on_same_contract(self, reqObj, res_class):
-        """ Only 1 streaming tick data request per contract is allowed every 15 seconds. """
-        container = self.get_container(reqObj, res_class)
-        return not container.full()
-
+            return len(self.get_container(reqObj, res_class)) < limit
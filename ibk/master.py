@@ -1,3 +1,8 @@
+import time
+
+import numpy as np
+import pandas as pd
+
 import ibk.account
 import ibk.constants
 import ibk.connect
@@ -13,6 +18,7 @@ class Master(object):
     def __init__(self, port, host=None):
         super().__init__()
         self._port = port
+        self._apps = dict()
         self.connection_manager = ibk.connect.ConnectionManager(port=port, host=host)
 
     def disconnect(self):
@@ -21,6 +27,7 @@ class Master(object):
 
     def reset_connections(self):
         """ Reset all connections. """
+        self._apps.clear()
         self.connection_manager.reset_connections()
         
     def __del__(self):
@@ -183,20 +190,44 @@ class Master(object):
     ##################################################################
     
     def get_market_data_snapshots(self, contractList, fields=""):
-        reqObjList = self.marketdata_app.create_market_data_request(contractList,
-                                                                    is_snapshot=True,
-                                                                    fields=fields)
+        reqObjList = [ibk.marketdata.create_market_data_request(contract, is_snapshot=True, fields=fields)
+                      for contract in contractList]
+
         # Place data requests for all request objects
-        [reqObj.place_request() for reqObj in reqObjList]
+        ibk.marketdata.place_requests(reqObjList)
         return reqObjList
 
+    def get_snapshot(self, contractList, fields="", max_wait_time=None):
+        """ Get a snapshot of the current market data for a list of contracts.
+
+            Arguments:
+                contractList: (list) the Contract objects for which market data is requested.
+                fields: (str) additional tick data codes that are requested.
+                max_wait_time: (int) the maximum time (in seconds) to wait for
+                    the data. The default is MARKETDATA_MAX_WAIT_TIME.
+
+            Returns: (DataFrame) the market data, indexed by localSymbol, with a column
+                for each tick type returned by IB (e.g. 'LAST' and 'CLOSE').
+        """
+        if max_wait_time is None:
+            max_wait_time = MARKETDATA_MAX_WAIT_TIME
+
+        reqObjList = self.get_market_data_snapshots(contractList, fields=fields)
+
+        t0 = time.time()
+        while any([reqObj.is_active() for reqObj in reqObjList]) and time.time() - t0 < max_wait_time:
+            time.sleep(0.1)
+
+        index = pd.Index([contract.localSymbol for contract in contractList], name='localSymbol')
+        return pd.DataFrame([reqObj.get_data() for reqObj in reqObjList], index=index)
+
     def get_fundamental_data(self, contractList, report_type="ratios", options=None):
         reqObjList = self.marketdata_app.create_fundamental_data_request(contractList,
                                                                          report_type=report_type,
                                                                          options=options)
 
         # Place data requests for all request objects
-        [reqObj.place_request() for reqObj in reqObjList]
+        ibk.marketdata.place_requests(reqObjList)
         return reqObjList
 
     def get_historical_data(self, contractList, frequency, use_rth=True, data_type="TRADES",
@@ -211,7 +242,7 @@ class Master(object):
                                                                         duration=duration)
         # Place data requests for all request objects
         if place:
-            [reqObj.place_request() for reqObj in reqObjList]
+            ibk.marketdata.place_requests(reqObjList)
         return reqObjList
 
     def open_historical_data_streams(self, contractList, frequency, use_rth=True,
@@ -291,19 +322,30 @@ class Master(object):
 
     @property
     def contracts_app(self):
-        return self.connection_manager.get_connection(ibk.contracts.ContractsApp)
+        return self._get_app(ibk.contracts.ContractsApp)
 
     @property
     def orders_app(self):
-        return self.connection_manager.get_connection(ibk.orders.OrdersApp)
+        return self._get_app(ibk.orders.OrdersApp)
 
     @property
     def marketdata_app(self):
-        return self.connection_manager.get_connection(ibk.marketdata.MarketDataApp)
+        return self._get_app(ibk.marketdata.MarketDataApp)
 
     @property
     def account_app(self):
-        return self.connection_manager.get_connection(ibk.account.AccountApp)
+        return self._get_app(ibk.account.AccountApp)
+
+    def _get_app(self, class_handle):
+        """ Get the connection for a given App class.
+
+            The connection is cached, and is only looked up again from the
+            ConnectionManager if the cached App is no longer connected.
+        """
+        app = self._apps.get(class_handle, None)
+        if app is None or not app.isConnected():
+            app = self._apps[class_handle] = self.connection_manager.get_connection(class_handle)
+        return app
 
     ##################################################################
     # Private functions
@@ -318,23 +360,20 @@ class Master(object):
         Returns:
             A copy of the original DataFrame, with 'price' and 'mktVal' columns included.
         """
-        # Get the market data for each localSymbol in df_pos
+        # Get the market data for each localSymbol in df_pos with a single snapshot request
         local_symbols = df_pos['localSymbol']
-        contracts = [self.get_contract(s) for s in local_symbols]
-        mkt_data = self.get_snapshot(contracts)
-
-        prices = np.nan * np.ones_like(local_symbols)
-        for j, symbol in enumerate(local_symbols):
-            _contract = self.get_contract(symbol)
-            if _contract.secType != 'CASH':
-                mkt_data = self.get_snapshot([_contract])
-                if 'last_price' in mkt_data:
-                    prices[j] = float(mkt_data['last_price'][symbol])
-                elif 'close_price' in mkt_data:
-                    prices[j] = float(mkt_data['close_price'][symbol])
-
-        # Add a column with market value info at the end of the Data Frame
-        pos = df_pos.copy()
-        pos.insert(pos.shape[1], 'price', prices)
-        pos.insert(pos.shape[1], 'mktVal', prices * pos['multiplier'] * pos['size'])
-        return pos
+        contracts = {s: self.get_contract(s) for s in local_symbols.unique()}
+        contracts_non_cash = [c for c in contracts.values() if c.secType != 'CASH']
+        mkt_data = self.get_snapshot(contracts_non_cash)
+
+        # Use the last price of each symbol if there is one, or else the close price
+        missing = pd.Series(np.nan, index=mkt_data.index)
+        last_prices = pd.to_numeric(mkt_data.get('LAST', missing), errors='coerce')
+        close_prices = pd.to_numeric(mkt_data.get('CLOSE', missing), errors='coerce')
+        price_map = last_prices.combine_first(close_prices)
+
+        # Symbols without market data (e.g. CASH) are given a price of NaN
+        prices = local_symbols.map(price_map).astype(np.float64)
+
+        # Add columns with market value info at the end of the Data Frame
+        return df_pos.assign(price=prices, mktVal=prices * df_pos['multiplier'] * df_pos['size'])
@@ -0,0 +1,67 @@
+"""Tests for the MarketDataApp connection to IB.
+
+The tests here do not connect to IB. The heartbeat thread is run with a
+short interval, and the methods that talk to IB are replaced by mocks.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import ibk.marketdata.app
+from ibk.marketdata.app import MarketDataApp
+
+
+class HeartbeatTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self.app = MarketDataApp()
+        self._patchers = [patch.object(ibk.marketdata.app, 'HEARTBEAT_INTERVAL_SECS', 0.01),
+                          patch.object(ibk.marketdata.app, 'MAX_RECONNECT_BACKOFF_SECS', 0.02)]
+        for patcher in self._patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        self.app.stop_heartbeat()
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def _wait_for_calls(self, mock, n_calls, max_wait_time=5):
+        t0 = time.time()
+        while mock.call_count < n_calls and time.time() - t0 < max_wait_time:
+            time.sleep(0.01)
+        return mock.call_count >= n_calls
+
+    def test_unexpected_reconnect_error(self):
+        """ Test that the heartbeat keeps running when reconnecting raises an unexpected exception. """
+        restarted = threading.Event()
+        errors = [AttributeError('No connection info'), OSError('Socket is closed')]
+
+        def restart_connection(force=False):
+            if errors:
+                raise errors.pop(0)
+            restarted.set()
+
+        with patch.object(self.app, 'is_healthy', return_value=False), \
+                patch.object(self.app, 'restart_connection', side_effect=restart_connection) as mock_restart, \
+                self.assertLogs(level='ERROR') as logs:
+            self.app._start_heartbeat()
+            self.assertTrue(restarted.wait(timeout=5))
+            self.assertTrue(self.app._heartbeat_thread.is_alive())
+            self.assertGreaterEqual(mock_restart.call_count, 3)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_unexpected_ping_error(self):
+        """ Test that the heartbeat keeps running when the heartbeat request raises an exception. """
+        with patch.object(self.app, 'is_healthy', return_value=True), \
+                patch.object(self.app, 'reqCurrentTime', side_effect=OSError('Socket is closed')) as mock_ping, \
+                self.assertLogs(level='ERROR'):
+            self.app._start_heartbeat()
+            self.assertTrue(self._wait_for_calls(mock_ping, 3))
+            self.assertTrue(self.app._heartbeat_thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
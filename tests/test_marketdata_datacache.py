@@ -0,0 +1,193 @@
+"""Tests for the disk-backed market data cache.
+
+The tests here do not send any requests to IB. Cache files are written
+to a temporary directory that is removed after each test.
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import ibapi.contract
+
+import ibk.marketdata
+import ibk.marketdata.constants as mdconst
+import ibk.marketdata.datacache
+from ibk.marketdata.datacache import DataCache
+from ibk.marketdata.datarequest import FundamentalDataRequest, HeadTimeStampDataRequest
+
+
+class DataCacheTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self._tmp_dir.name, 'marketdata_cache.pkl')
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        self._tmp_dir.cleanup()
+
+    def test_hit(self):
+        """ Test that a saved value can be read back, including by a new cache instance. """
+        cache = DataCache(self.filename)
+        cache.set('key', 42)
+        self.assertEqual(cache.get('key'), 42)
+        self.assertEqual(DataCache(self.filename).get('key'), 42)
+
+    def test_miss(self):
+        """ Test that missing keys return None. """
+        cache = DataCache(self.filename)
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', 42)
+        self.assertIsNone(cache.get('other_key'))
+
+    def test_expiry(self):
+        """ Test that values are only returned while they are younger than the ttl. """
+        cache = DataCache(self.filename)
+        with patch('ibk.marketdata.datacache.time') as mock_time:
+            mock_time.time.return_value = 1000.0
+            cache.set('key', 42)
+
+            mock_time.time.return_value = 1010.0
+            self.assertEqual(cache.get('key', ttl=20), 42)
+            self.assertEqual(cache.get('key'), 42)
+
+            mock_time.time.return_value = 1030.0
+            self.assertIsNone(cache.get('key', ttl=20))
+            self.assertEqual(cache.get('key'), 42)
+
+    def test_clear(self):
+        """ Test that clearing the cache removes the values and the file. """
+        cache = DataCache(self.filename)
+        cache.set('key', 42)
+        cache.clear()
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertIsNone(DataCache(self.filename).get('key'))
+
+    def test_no_temporary_files(self):
+        """ Test that writing the cache does not leave any temporary files behind. """
+        cache = DataCache(self.filename)
+        cache.set('key', 42)
+        cache.set('other_key', 43)
+        self.assertEqual(os.listdir(self._tmp_dir.name), [os.path.basename(self.filename)])
+
+    def test_corrupt_file(self):
+        """ Test that a truncated cache file is replaced by an empty cache. """
+        cache = DataCache(self.filename)
+        cache.set('key', 42)
+
+        # Truncate the file, as a crash during a write would
+        with open(self.filename, 'rb') as handle:
+            contents = handle.read()
+        with open(self.filename, 'wb') as handle:
+            handle.write(contents[:len(contents) // 2])
+
+        cache = DataCache(self.filename)
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(cache.get('key'))
+
+        # The cache can still be used, and the file is valid again
+        cache.set('key', 43)
+        with open(self.filename, 'rb') as handle:
+            self.assertEqual(pickle.load(handle)['key'][1], 43)
+
+    def test_empty_file(self):
+        """ Test that an empty cache file is replaced by an empty cache. """
+        open(self.filename, 'wb').close()
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(DataCache(self.filename).get('key'))
+
+
+class DataRequestCacheTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call.
+
+            The global data cache is replaced by a cache in a temporary directory.
+        """
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.data_cache = DataCache(os.path.join(self._tmp_dir.name, 'marketdata_cache.pkl'))
+        self._patcher = patch.object(ibk.marketdata.datacache, 'data_cache', self.data_cache)
+        self._patcher.start()
+        self.request_manager = ibk.marketdata.GlobalRequestManager()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        self._patcher.stop()
+        self._tmp_dir.cleanup()
+
+    def _get_contract_stock(self, symbol, conId):
+        contract = ibapi.contract.Contract()
+        contract.symbol = symbol
+        contract.localSymbol = symbol
+        contract.conId = conId
+        contract.secType = "STK"
+        contract.currency = "USD"
+        contract.exchange = "SMART"
+        return contract
+
+    def test_cache_hit_completes_request(self):
+        """ Test that a request found in the cache is completed without being sent to IB. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        reqObj = HeadTimeStampDataRequest(self.request_manager, contract)
+        self.data_cache.set(reqObj._cache_key, 'first_date')
+
+        # The request manager has no app, so this would fail if the request were sent to IB
+        with patch.object(self.request_manager, '_get_app', side_effect=AssertionError):
+            reqObj.place_request()
+
+        self.assertEqual(reqObj.status, mdconst.STATUS_REQUEST_COMPLETE)
+        self.assertTrue(reqObj._done_event.is_set())
+        self.assertEqual(reqObj.get_data(), 'first_date')
+        self.assertIsNone(reqObj.req_id)
+
+        # The completion is recorded by the request manager
+        req_status = self.request_manager.requests[reqObj.uniq_id]
+        self.assertIsNotNone(req_status.info[mdconst.STATUS_REQUEST_COMPLETE])
+        self.assertEqual(self.request_manager.get_active_requests(), [])
+
+    def test_cache_miss(self):
+        """ Test that requests missing from the cache are not loaded from it. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        reqObj = HeadTimeStampDataRequest(self.request_manager, contract)
+        self.assertFalse(reqObj._load_from_cache())
+        self.assertFalse(reqObj.has_data())
+
+    def test_bypass_cache(self):
+        """ Test that 'bypass_cache' ignores values in the cache. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        reqObj = HeadTimeStampDataRequest(self.request_manager, contract, bypass_cache=True)
+        self.data_cache.set(reqObj._cache_key, 'first_date')
+        self.assertFalse(reqObj._load_from_cache())
+        self.assertFalse(reqObj.has_data())
+
+    def test_no_conId(self):
+        """ Test that contracts without a conId are never loaded from the cache. """
+        contract = self._get_contract_stock('SPY', conId=0)
+        reqObj = HeadTimeStampDataRequest(self.request_manager, contract)
+        self.data_cache.set(reqObj._cache_key, 'first_date')
+        self.assertFalse(reqObj._load_from_cache())
+
+    def test_fundamental_data_expiry(self):
+        """ Test that cached fundamental data reports expire after their ttl. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        reqObj = FundamentalDataRequest(self.request_manager, contract, is_snapshot=True,
+                                        report_type='ReportSnapshot')
+        with patch('ibk.marketdata.datacache.time') as mock_time:
+            mock_time.time.return_value = 1000.0
+            self.data_cache.set(reqObj._cache_key, 'report')
+
+            mock_time.time.return_value = 1000.0 + ibk.marketdata.datacache.FUNDAMENTAL_DATA_CACHE_TTL / 2
+            self.assertTrue(reqObj._load_from_cache())
+            self.assertEqual(reqObj.get_data(), 'report')
+
+            reqObj._initialize_data()
+            mock_time.time.return_value = 1000.0 + 2 * ibk.marketdata.datacache.FUNDAMENTAL_DATA_CACHE_TTL
+            self.assertFalse(reqObj._load_from_cache())
+            self.assertFalse(reqObj.has_data())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Tests for the market data request classes.
+
+The tests here do not send any requests to IB. They check how the requests
+are constructed and how the data returned by IB is stored and converted.
+"""
+
+import datetime
+import ibapi.contract
+import numpy as np
+import unittest
+
+import ibk.marketdata
+from ibk.marketdata.datarequest import HistoricalDataMultiRequest, HistoricalDataRequest, MIN_BAR_CAPACITY
+
+
+class HistoricalDataRequestTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self.request_manager = ibk.marketdata.GlobalRequestManager()
+        self.contract = self._get_contract_stock('SPY')
+
+    def _get_contract_stock(self, symbol):
+        contract = ibapi.contract.Contract()
+        contract.symbol = symbol
+        contract.localSymbol = symbol
+        contract.secType = "STK"
+        contract.currency = "USD"
+        contract.exchange = "SMART"
+        return contract
+
+    def _create_multi_request(self, frequency, start, end):
+        return HistoricalDataMultiRequest(self.request_manager, self.contract, is_snapshot=True,
+                                          frequency=frequency, start=start, end=end)
+
+    def _get_bar(self, date, price, volume):
+        return dict(date=date, open=price, high=price + 1, low=price - 1, close=price + 0.5,
+                    volume=volume, barCount=volume // 10, average=price + 0.25)
+
+    def test_split_into_valid_periods(self):
+        """ Test that long requests are split into contiguous periods that IB accepts. """
+        start = datetime.datetime(2022, 1, 3, 9)
+        end = datetime.datetime(2022, 3, 1, 16)
+        reqObj = self._create_multi_request('1h', start, end)
+
+        periods = reqObj._split_into_valid_periods(start, end)
+        expected = [(start, datetime.datetime(2022, 1, 3, 18)),
+                    (datetime.datetime(2022, 1, 3, 18), datetime.datetime(2022, 2, 2, 18)),
+                    (datetime.datetime(2022, 2, 2, 18), end)]
+        self.assertEqual(periods, expected)
+
+        # Short requests are not split
+        short_end = datetime.datetime(2022, 1, 3, 16)
+        self.assertEqual(reqObj._split_into_valid_periods(start, short_end), [(start, short_end)])
+
+    def test_split_into_valid_periods_daily(self):
+        """ Test that daily periods begin and end at 18:00, following the TWS convention. """
+        start = datetime.datetime(2020, 1, 3, 9)
+        end = datetime.datetime(2022, 1, 10, 16)
+        reqObj = self._create_multi_request('1d', start, end)
+
+        periods = reqObj._split_into_valid_periods(start, end)
+        self.assertEqual(periods[0][0], datetime.datetime(2020, 1, 2, 18))
+        self.assertEqual(periods[-1][1], datetime.datetime(2022, 1, 10, 18))
+        for (_, period_end), (next_start, _) in zip(periods[:-1], periods[1:]):
+            self.assertEqual(period_end, next_start)
+            self.assertEqual(period_end.time(), datetime.time(18, 0))
+
+    def test_subrequests_are_independent(self):
+        """ Test that the subrequests copied from the first one do not share any state. """
+        start = datetime.datetime(2022, 1, 3, 9)
+        end = datetime.datetime(2022, 3, 1, 16)
+        reqObj = self._create_multi_request('1h', start, end)
+        subrequests = reqObj.subrequests
+        self.assertEqual(len(subrequests), 3)
+
+        # The subrequests cover the periods returned by _split_into_valid_periods
+        periods = reqObj._split_into_valid_periods(start, end)
+        self.assertEqual([(r.start, r.end) for r in subrequests], periods)
+
+        # The settings are copied from the first subrequest
+        for r in subrequests:
+            self.assertEqual(r.frequency, '1h')
+            self.assertEqual(r._freq_seconds, 3600)
+            self.assertEqual(r.data_type, 'TRADES')
+
+        # ...but the mutable state is not shared
+        for attr in ('uniq_id', '_columns', '_done_event', '_restriction_keys', 'chartOptions'):
+            with self.subTest(attr=attr):
+                values = [getattr(r, attr) for r in subrequests]
+                self.assertEqual(len(set(map(id, values))), len(values))
+        self.assertEqual(len({r.uniq_id for r in subrequests}), len(subrequests))
+
+        # Data, events and restriction keys added to one subrequest do not affect the others
+        subrequests[0]._append_data(self._get_bar(datetime.datetime(2022, 1, 3, 10), 100.0, 10))
+        subrequests[0]._done_event.set()
+        subrequests[0]._restriction_keys['key'] = 'value'
+        for r in subrequests[1:]:
+            self.assertFalse(r.has_data())
+            self.assertFalse(r._done_event.is_set())
+            self.assertEqual(r._restriction_keys, dict())
+
+    def test_get_dataframe(self):
+        """ Test that the bars are stored in numpy columns and returned in a DataFrame. """
+        start = datetime.datetime(2022, 1, 3, 0)
+        end = datetime.datetime(2022, 1, 10, 0)
+        reqObj = HistoricalDataRequest(self.request_manager, self.contract, is_snapshot=True,
+                                       frequency='1h', start=start, end=end)
+
+        # Add more bars than the initial capacity of the columns, in reverse order
+        n_bars = 2 * MIN_BAR_CAPACITY + 1
+        dates = [start + datetime.timedelta(hours=k) for k in range(n_bars)]
+        for k in reversed(range(n_bars)):
+            reqObj._append_data(self._get_bar(dates[k], 100.0 + k, 10 * k))
+        self.assertTrue(reqObj.has_data())
+
+        columns = reqObj._get_columns()
+        self.assertEqual(columns['open'].dtype, np.float64)
+        self.assertEqual(columns['volume'].dtype, np.int64)
+        self.assertEqual(len(columns['close']), n_bars)
+
+        df = reqObj.get_dataframe()
+        self.assertEqual(df.index.name, 'date')
+        self.assertTrue(df.index.is_monotonic_increasing)
+        self.assertEqual(list(df.columns), ['open', 'high', 'low', 'close', 'volume', 'barCount', 'average'])
+
+        # The first bar is always kept, even though its volume is zero
+        self.assertEqual(len(df), n_bars)
+        self.assertEqual(df.index[0], dates[0])
+        self.assertEqual(df['close'].iloc[-1], 100.0 + (n_bars - 1) + 0.5)
+        self.assertEqual(df['volume'].iloc[-1], 10 * (n_bars - 1))
+
+    def test_get_dataframe_drops_empty_rows(self):
+        """ Test that bars without trades are dropped, and the rows are restricted to the request dates. """
+        start = datetime.datetime(2022, 1, 3, 10)
+        end = datetime.datetime(2022, 1, 3, 14)
+        reqObj = HistoricalDataRequest(self.request_manager, self.contract, is_snapshot=True,
+                                       frequency='1h', start=start, end=end)
+        volumes = [5, 0, 7, 0, 3, 9]
+        for k, volume in enumerate(volumes):
+            reqObj._append_data(self._get_bar(datetime.datetime(2022, 1, 3, 9 + k), 100.0 + k, volume))
+
+        df = reqObj.get_dataframe()
+        self.assertEqual(list(df.index.hour), [10, 11, 13, 14])
+        self.assertEqual(list(df['volume']), [0, 7, 3, 9])
+
+        df_all = reqObj.get_dataframe(drop_empty_rows=False)
+        self.assertEqual(list(df_all.index.hour), [10, 11, 12, 13, 14])
+
+    def test_multi_request_get_dataframe(self):
+        """ Test that the columns of the subrequests are joined into a single DataFrame. """
+        start = datetime.datetime(2022, 1, 3, 9)
+        end = datetime.datetime(2022, 3, 1, 16)
+        reqObj = self._create_multi_request('1h', start, end)
+        for k, r in enumerate(reqObj.subrequests):
+            r._append_data(self._get_bar(r.start + datetime.timedelta(hours=1), 100.0 + k, 10))
+
+        df = reqObj.get_dataframe()
+        self.assertEqual(len(df), len(reqObj.subrequests))
+        self.assertEqual(list(df['open']), [100.0, 101.0, 102.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
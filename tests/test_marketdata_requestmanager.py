@@ -9,15 +9,20 @@ in the test_marketdata.py test suite.
 
 import datetime
 import ibapi
+import ibapi.contract
 import numpy as np
 import pandas as pd
+import threading
 import time
 import unittest
-from unittest.mock import Mock
+import weakref
+from unittest.mock import Mock, patch
 
 import ibk.constants
 import ibk.marketdata
 import ibk.marketdata.constants as mdconst
+import ibk.marketdata.datarequest
+import ibk.marketdata.requestmanager
 
 
 class MockMarketDataApp:
@@ -33,6 +38,12 @@ class MockMarketDataApp:
         self._internal_counter[0] += 1        
         return self._internal_counter[0]
 
+    def register_request(self, reqObj):
+        self.requests[reqObj.req_id] = reqObj
+
+    def isConnected(self):
+        return True
+
     def reqScannerSubscription(self, reqId, **kwargs):
         pass
 
@@ -164,5 +175,205 @@ class RequestManagerTest(unittest.TestCase):
         #    self.assertEqual(cnt_1, single_order.contract, msg='Contract mismatch.')
 
 
+
+class RequestQueueTest(unittest.TestCase):
+    """ Test the processing of requests by the request queues, without sending anything to IB. """
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self.request_manager = ibk.marketdata.GlobalRequestManager()
+        self.request_manager._get_app = Mock(return_value=MockMarketDataApp())
+
+        # Replace the monitoring queue, so that no thread is started to monitor the requests
+        self.request_manager.queues[mdconst.QUEUE_MONITORING] = Mock()
+
+        # Let the queue threads exit quickly once they are idle
+        self._patchers = [patch.object(ibk.marketdata.requestmanager, 'QUEUE_IDLE_TIMEOUT', 0.1),
+                          patch.object(ibk.marketdata.requestmanager, 'REQUEST_PROPAGATION_TIMEOUT', 0.1)]
+        for patcher in self._patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def test_timed_out_request_is_registered_again(self):
+        """ Test that a request that times out is re-registered with a new req_id before it is placed again. """
+        contract = ibapi.contract.Contract()
+        contract.symbol = contract.localSymbol = 'SPY'
+        reqObj = ibk.marketdata.datarequest.MarketDataRequest(self.request_manager, contract, is_snapshot=True)
+
+        placed = []
+        placed_again = threading.Event()
+        place_request_with_ib = ibk.marketdata.datarequest.DataRequest._place_request_with_ib
+
+        def _place_request_with_ib(request, app):
+            req_status = self.request_manager.requests[request.uniq_id]
+            placed.append((request.req_id, req_status.info[mdconst.STATUS_REQUEST_QUEUED]))
+            if len(placed) > 1:
+                place_request_with_ib(request, app)
+                placed_again.set()
+            # The first time, nothing is sent to IB, so the request times out
+
+        with patch.object(ibk.marketdata.datarequest.DataRequest, '_place_request_with_ib',
+                          _place_request_with_ib):
+            self.request_manager.place_request(reqObj)
+            self.assertTrue(placed_again.wait(timeout=10))
+
+        (req_id_1, t_queued_1), (req_id_2, t_queued_2) = placed
+        self.assertIsNotNone(req_id_2)
+        self.assertNotEqual(req_id_1, req_id_2)
+        self.assertEqual(reqObj.req_id, req_id_2)
+
+        # The request was registered (and its status recorded) again before it was placed
+        self.assertIsNotNone(t_queued_2)
+        self.assertGreater(t_queued_2, t_queued_1)
+        self.assertEqual(reqObj.status, mdconst.STATUS_REQUEST_SENT_TO_IB)
+        self.assertIn(reqObj, self.request_manager.get_active_requests())
+
+
+class SharedRequestTest(unittest.TestCase):
+    """ Test the sharing of identical snapshot requests created by the factory functions. """
+    def setUp(self):
+        """ Perform any required set-up before each method call.
+
+            The request queues are replaced by a mock, so that placed requests
+            stay queued instead of being processed by the queue threads. Each test
+            starts without any shared requests left over from the previous tests.
+        """
+        self.app = MockMarketDataApp()
+        self._patchers = [patch.object(ibk.marketdata.request_manager, '_get_app', return_value=self.app),
+                          patch.object(ibk.marketdata.request_manager, 'get_assigned_queue', return_value=Mock()),
+                          patch.object(ibk.marketdata.request_manager, '_inflight', weakref.WeakValueDictionary())]
+        for patcher in self._patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def _get_contract_stock(self, symbol, conId):
+        contract = ibapi.contract.Contract()
+        contract.symbol = symbol
+        contract.localSymbol = symbol
+        contract.conId = conId
+        contract.secType = "STK"
+        contract.currency = "USD"
+        contract.exchange = "SMART"
+        return contract
+
+    def test_snapshot_requests_are_shared(self):
+        """ Test that identical snapshot requests are only placed once. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        req_1 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+        req_1.place_request()
+        req_2 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+
+        # Both callers get the request object itself
+        self.assertIs(req_1, req_2)
+        self.assertIsInstance(req_2, ibk.marketdata.datarequest.MarketDataRequest)
+        with patch.object(ibk.marketdata.request_manager, 'place_request') as mock_place:
+            req_2.place_request()
+            mock_place.assert_not_called()
+        self.assertEqual(req_2.status, mdconst.STATUS_REQUEST_QUEUED)
+
+        # Requests with different arguments are not shared
+        req_3 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True, fields="233")
+        self.assertIsNot(req_1, req_3)
+
+    def test_new_requests_are_shared(self):
+        """ Test that identical requests created before they are placed are only placed once. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        contracts = [contract, self._get_contract_stock('QQQ', conId=320227571), contract]
+        reqObjs = [ibk.marketdata.create_market_data_request(c, is_snapshot=True) for c in contracts]
+        self.assertIs(reqObjs[0], reqObjs[2])
+        self.assertIsNot(reqObjs[0], reqObjs[1])
+
+        with patch.object(ibk.marketdata.request_manager, '_register_new_request',
+                          wraps=ibk.marketdata.request_manager._register_new_request) as mock_register:
+            ibk.marketdata.place_requests(reqObjs)
+            self.assertEqual(mock_register.call_count, 2)
+        self.assertEqual(reqObjs[0].status, mdconst.STATUS_REQUEST_QUEUED)
+
+        # Placing the request again from one of its callers does nothing
+        reqObjs[2].place_request()
+
+    def test_historical_requests_are_shared(self):
+        """ Test that identical historical multi-requests created before they are placed are shared. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        kwargs = dict(frequency='1h', start=datetime.datetime(2022, 1, 3, 9), end=datetime.datetime(2022, 3, 1, 16))
+        req_1 = ibk.marketdata.create_historical_data_request(contract, is_snapshot=True, **kwargs)
+        req_2 = ibk.marketdata.create_historical_data_request(contract, is_snapshot=True, **kwargs)
+        self.assertIs(req_1, req_2)
+        self.assertIsInstance(req_1, ibk.marketdata.datarequest.HistoricalDataMultiRequest)
+
+        req_1.place_request()
+        req_2.place_request()
+        for reqObj in req_1.subrequests:
+            self.assertEqual(reqObj.status, mdconst.STATUS_REQUEST_QUEUED)
+
+    def test_cancel_shared_request(self):
+        """ Test that a shared request is only cancelled once all of its callers have cancelled it. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        req_1 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+        req_1.place_request()
+        req_2 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+
+        with patch.object(self.app, 'cancelMktData') as mock_cancel:
+            req_1.cancel_request()
+            self.assertTrue(req_2.is_active())
+            mock_cancel.assert_not_called()
+
+            req_2.cancel_request()
+            self.assertEqual(req_2.status, mdconst.STATUS_REQUEST_CANCELLED)
+            mock_cancel.assert_called_once()
+
+        # Cancelled requests cannot be cancelled again
+        with self.assertRaises(ValueError):
+            req_1.cancel_request()
+
+    def test_place_active_request(self):
+        """ Test that placing a request that is not shared a second time raises an exception. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        reqObj = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+        reqObj.place_request()
+        with self.assertRaises(ValueError):
+            reqObj.place_request()
+
+        # The same holds for historical requests
+        reqObj = ibk.marketdata.create_historical_data_request(contract, is_snapshot=True, frequency='1h',
+                                                               duration='1d')
+        reqObj.place_request()
+        with self.assertRaises(ValueError):
+            reqObj.place_request()
+
+    def test_finished_requests_are_not_shared(self):
+        """ Test that a new request is created once the shared request has finished. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        req_1 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+        req_1.place_request()
+        req_1.cancel_request()
+
+        req_2 = ibk.marketdata.create_market_data_request(contract, is_snapshot=True)
+        self.assertIsNot(req_1, req_2)
+        self.assertEqual(req_2.status, mdconst.STATUS_REQUEST_NEW)
+
+    def test_streaming_requests_are_not_shared(self):
+        """ Test that each caller gets its own streaming request. """
+        contract = self._get_contract_stock('SPY', conId=756733)
+        req_1 = ibk.marketdata.create_market_data_request(contract, is_snapshot=False)
+        req_1.place_request()
+        req_2 = ibk.marketdata.create_market_data_request(contract, is_snapshot=False)
+        self.assertIsInstance(req_2, ibk.marketdata.datarequest.MarketDataRequest)
+        self.assertNotEqual(req_1.uniq_id, req_2.uniq_id)
+
+        # Cancelling one stream does not affect the other
+        req_2.place_request()
+        req_1.cancel_request()
+        self.assertTrue(req_2.is_active())
+        req_2.cancel_request()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
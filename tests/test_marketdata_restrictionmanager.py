@@ -0,0 +1,167 @@
+"""Tests for the RestrictionManager, which enforces IB's pacing restrictions.
+
+The tests here do not send any requests to IB. The monotonic clock used
+for the request windows is replaced by a mock, so that the windows can
+expire without waiting for them.
+"""
+
+import ibapi.contract
+import threading
+import unittest
+from unittest.mock import patch
+
+import ibk.marketdata.constants as mdconst
+import ibk.marketdata.restrictionmanager
+from ibk.marketdata.restrictionmanager import RestrictionManager, MAX_REQUESTS_PER_WINDOW, MAX_SIMUL_REQUESTS
+
+
+# Number of nanoseconds in a second
+NS = 10 ** 9
+
+
+class MockRequest:
+    """ A request with the attributes that are used by the RestrictionManager. """
+    def __init__(self, uniq_id, restriction_class, localSymbol='SPY', data_type='TRADES'):
+        self.uniq_id = uniq_id
+        self.restriction_class = restriction_class
+        self.contract = ibapi.contract.Contract()
+        self.contract.localSymbol = localSymbol
+        self.data_type = data_type
+        self.identical_key = f'{localSymbol}_{uniq_id}'
+        self._restriction_keys = dict()
+        self._status = mdconst.STATUS_REQUEST_NEW
+
+
+class RestrictionManagerTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self.restriction_manager = RestrictionManager()
+        self.uniq_id = 0
+
+        # Replace the clock used for the request windows
+        self.now_ns = 1000 * NS
+        self._patcher = patch.object(ibk.marketdata.restrictionmanager.time, 'monotonic_ns',
+                                     side_effect=lambda: self.now_ns)
+        self._patcher.start()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        self._patcher.stop()
+
+    def _create_request(self, restriction_class, **kwargs):
+        self.uniq_id += 1
+        return MockRequest(self.uniq_id, (restriction_class,), **kwargs)
+
+    def _set_status(self, reqObj, status):
+        reqObj._status = status
+        self.restriction_manager.update_status(reqObj)
+
+    def _send_requests(self, restriction_class, n, **kwargs):
+        """ Register 'n' requests as if they had been sent to IB. """
+        requests = [self._create_request(restriction_class, **kwargs) for _ in range(n)]
+        for reqObj in requests:
+            self.assertTrue(self.restriction_manager.all_satisfied(reqObj))
+            self._set_status(reqObj, mdconst.STATUS_REQUEST_SENT_TO_IB)
+        return requests
+
+    def _start_waiting(self, reqObj):
+        """ Start a thread that waits until the restrictions on a request are satisfied. """
+        thread = threading.Thread(target=self.restriction_manager.wait_until_satisfied, args=(reqObj,),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def _wake_waiting_threads(self):
+        with self.restriction_manager._cond:
+            self.restriction_manager._cond.notify_all()
+
+    def test_window_expiry(self):
+        """ Test that requests stop counting towards the limit once they leave the window. """
+        res_class = mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW
+        n, T = MAX_REQUESTS_PER_WINDOW[res_class]
+        self._send_requests(res_class, n)
+
+        reqObj = self._create_request(res_class)
+        self.assertFalse(self.restriction_manager.all_satisfied(reqObj))
+        self.assertEqual(self.restriction_manager.check_is_satisfied(reqObj), {res_class: False})
+
+        # The window is measured from the time the requests were sent
+        self.now_ns += T * NS - 1
+        self.assertFalse(self.restriction_manager.all_satisfied(reqObj))
+        self.now_ns += 1
+        self.assertTrue(self.restriction_manager.all_satisfied(reqObj))
+
+    def test_windows_are_kept_per_contract(self):
+        """ Test that the short window only counts the requests on the same contract. """
+        res_class = mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW
+        n, _ = MAX_REQUESTS_PER_WINDOW[res_class]
+        self._send_requests(res_class, n, localSymbol='SPY')
+
+        self.assertFalse(self.restriction_manager.all_satisfied(self._create_request(res_class, localSymbol='SPY')))
+        self.assertTrue(self.restriction_manager.all_satisfied(self._create_request(res_class, localSymbol='QQQ')))
+
+    def test_bid_ask_counts_twice(self):
+        """ Test that 'BID_ASK' requests count as two requests in the window. """
+        res_class = mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW
+        n, _ = MAX_REQUESTS_PER_WINDOW[res_class]
+        self._send_requests(res_class, n // 2, data_type='BID_ASK')
+        self.assertFalse(self.restriction_manager.all_satisfied(self._create_request(res_class)))
+
+    def test_time_to_next_expiry(self):
+        """ Test that waiting threads wake up when the oldest request in the window expires. """
+        res_class = mdconst.RESTRICTION_CLASS_HF_HIST_SHORT_WINDOW
+        n, T = MAX_REQUESTS_PER_WINDOW[res_class]
+        self._send_requests(res_class, n)
+        reqObj = self._create_request(res_class)
+
+        # The wait is capped, so that the restrictions are re-checked regularly
+        self.assertEqual(self.restriction_manager._get_time_to_next_expiry(reqObj),
+                         ibk.marketdata.restrictionmanager.MAX_RESTRICTION_WAIT)
+
+        self.now_ns += (T * NS) - NS // 4
+        self.assertAlmostEqual(self.restriction_manager._get_time_to_next_expiry(reqObj), 0.25)
+
+    def test_wait_until_window_expires(self):
+        """ Test that a waiting request is released once the window has expired. """
+        res_class = mdconst.RESTRICTION_CLASS_HF_HIST_IDENTICAL
+        _, T = MAX_REQUESTS_PER_WINDOW[res_class]
+        reqObj = self._send_requests(res_class, 1)[0]
+
+        # An identical request has to wait for the full window
+        identical_request = self._create_request(res_class)
+        identical_request.identical_key = reqObj.identical_key
+        thread = self._start_waiting(identical_request)
+        thread.join(timeout=0.1)
+        self.assertTrue(thread.is_alive())
+
+        self.now_ns += T * NS
+        self._wake_waiting_threads()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_wait_until_request_finishes(self):
+        """ Test that a request waiting for a simultaneous request limit is released when a request finishes. """
+        res_class = mdconst.RESTRICTION_CLASS_SIMUL_HIST
+        requests = self._send_requests(res_class, MAX_SIMUL_REQUESTS[res_class])
+
+        reqObj = self._create_request(res_class)
+        thread = self._start_waiting(reqObj)
+        thread.join(timeout=0.1)
+        self.assertTrue(thread.is_alive())
+
+        # Finishing a request (even with an error) frees its slot and wakes up the waiting thread
+        self._set_status(requests[0], mdconst.STATUS_REQUEST_ERROR)
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.restriction_manager.all_satisfied(reqObj))
+
+    def test_register_twice(self):
+        """ Test that registering the same open request twice raises an exception. """
+        res_class = mdconst.RESTRICTION_CLASS_SIMUL_STREAMS
+        reqObj = self._send_requests(res_class, 1)[0]
+        with self.assertRaises(ValueError):
+            self.restriction_manager.update_status(reqObj)
+
+
+if __name__ == '__main__':
+    unittest.main()
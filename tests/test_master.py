@@ -0,0 +1,94 @@
+"""Tests for the Master class.
+
+The tests here do not connect to IB. The market data snapshots and the
+account positions are replaced by mocks that return simulated data.
+"""
+
+import ibapi.contract
+import numpy as np
+import pandas as pd
+import unittest
+from unittest.mock import Mock, PropertyMock, patch
+
+import ibk.constants
+import ibk.master
+
+
+class MasterMarketValueTest(unittest.TestCase):
+    def setUp(self):
+        """ Perform any required set-up before each method call. """
+        self.app = ibk.master.Master(port=ibk.constants.PORT_PAPER)
+        self.contracts = {'SPY': self._get_contract('SPY', 'STK'),
+                          'QQQ': self._get_contract('QQQ', 'STK'),
+                          'EUR.USD': self._get_contract('EUR.USD', 'CASH')}
+
+        # Simulated snapshots: IB does not always return a last price
+        self.snapshots = {'SPY': dict(LAST=400.0, CLOSE=398.0, BID=399.9),
+                          'QQQ': dict(CLOSE=300.0, BID=299.9)}
+
+        self._patchers = [patch.object(self.app, 'get_contract', side_effect=self.contracts.get),
+                          patch.object(self.app, 'get_market_data_snapshots',
+                                       side_effect=self._get_market_data_snapshots)]
+        for patcher in self._patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """ Remove anything from 'setUp' after each method call. """
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def _get_contract(self, localSymbol, secType):
+        contract = ibapi.contract.Contract()
+        contract.symbol = localSymbol
+        contract.localSymbol = localSymbol
+        contract.secType = secType
+        return contract
+
+    def _get_market_data_snapshots(self, contractList, fields=""):
+        reqObjList = []
+        for contract in contractList:
+            reqObj = Mock()
+            reqObj.is_active.return_value = False
+            reqObj.get_data.return_value = self.snapshots[contract.localSymbol]
+            reqObjList.append(reqObj)
+        return reqObjList
+
+    def _get_positions(self):
+        positions = pd.DataFrame(dict(localSymbol=['SPY', 'QQQ', 'EUR.USD'],
+                                      secType=['STK', 'STK', 'CASH'],
+                                      size=[10.0, -5.0, 1000.0],
+                                      multiplier=[1.0, 1.0, 1.0]))
+        return positions.set_index('localSymbol', drop=False)
+
+    def test_get_snapshot(self):
+        """ Test that the snapshots are returned in a DataFrame indexed by localSymbol. """
+        df = self.app.get_snapshot([self.contracts['SPY'], self.contracts['QQQ']])
+        self.assertEqual(list(df.index), ['SPY', 'QQQ'])
+        self.assertEqual(df.loc['SPY', 'LAST'], 400.0)
+        self.assertTrue(np.isnan(df.loc['QQQ', 'LAST']))
+
+    def test_include_mv_in_positions(self):
+        """ Test that the last price is used when available, and the close price otherwise. """
+        df = self.app._include_mv_in_positions(self._get_positions())
+        self.assertEqual(df['price'].dtype, np.float64)
+        self.assertEqual(df.loc['SPY', 'price'], 400.0)
+        self.assertEqual(df.loc['QQQ', 'price'], 300.0)
+        self.assertEqual(df.loc['QQQ', 'mktVal'], -1500.0)
+
+        # CASH positions are not requested, and have no price
+        self.assertTrue(np.isnan(df.loc['EUR.USD', 'price']))
+        requested = self.app.get_market_data_snapshots.call_args[0][0]
+        self.assertEqual([c.localSymbol for c in requested], ['SPY', 'QQQ'])
+
+    def test_get_positions_with_market_value(self):
+        """ Test that get_positions includes the market values if they are requested. """
+        account_app = Mock()
+        account_app.get_positions.return_value = (self._get_positions(), list(self.contracts.values()))
+        with patch.object(ibk.master.Master, 'account_app', new_callable=PropertyMock,
+                          return_value=account_app):
+            positions, _ = self.app.get_positions(include_mv=True)
+        self.assertEqual(list(positions['mktVal'].iloc[:2]), [4000.0, -1500.0])
+
+
+if __name__ == '__main__':
+    unittest.main()